@@ -0,0 +1,140 @@
+"""
+Fan-out benchmark, runs the net_tui workflows against mock Junos devices (mock_junos.py) and
+reports the end to end latency, throughput and peak memory of each, for each inventory size.
+Every workflow runs in a fresh interpreter with an empty cache, so the memory is its own.
+
+    python benchmarks/fanout.py --hosts 10,1000,10000 --latency 0.05 --jitter 0.02 --failure-rate 0.01
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import fields
+
+import yaml
+
+from mock_junos import MockProfile
+from startup import REPO_DIR, make_inventory
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Workflow -> its arguments, make_inventory names the hosts R0..Rn
+WORKFLOWS = {
+    'dasbboard_build': ('R0',),
+    'fleet_build': ('',),
+    'card_fetch': ('MPC7E',),
+    'cfg_fetch': ('protocols bgp group',),
+    'cmd_fetch': ('show version,show bgp summary',),
+    'checks_generate': ('R0', 'terse'),
+}
+
+
+def max_rss_mb():
+    # ru_maxrss is in KB on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def failed_hosts(app, workflow):
+    if workflow in ('card_fetch', 'cfg_fetch', 'cmd_fetch'):
+        return app.stream_counts['failed']
+    if workflow == 'fleet_build':
+        return sum(1 for row in app.fleet_rows.values() if row['status'] != 'ok')
+    return None
+
+
+async def run_workflow(workflow, hosts, profile):
+    """Runs the workflow in the app against the mock devices, returns its measurements"""
+    import net_tui
+    import mock_junos
+
+    # Only the workflow is measured, the hardware index isn't refreshed in the background
+    net_tui.NetTUI.hw_index_refresh = lambda self, *args, **kwargs: None
+    app = net_tui.NetTUI()
+    async with app.run_test(size=(200, 60)):
+        while app.sub_title == 'loading inventory':
+            await asyncio.sleep(0.01)
+        mock_junos.install(profile)
+        rss_before = max_rss_mb()
+        start = time.perf_counter()
+        worker = getattr(app, workflow)(*WORKFLOWS[workflow])
+        while worker.state in (net_tui.WorkerState.PENDING, net_tui.WorkerState.RUNNING):
+            await asyncio.sleep(0.005)
+        seconds = time.perf_counter() - start
+        # Letting the last fleet rows be flushed to the table
+        await asyncio.sleep(0.6)
+        devices = hosts if workflow in ('fleet_build', 'card_fetch', 'cfg_fetch', 'cmd_fetch') else 1
+        return {'workflow': workflow, 'hosts': hosts, 'state': worker.state.name, 'seconds': seconds,
+                'hosts_per_second': devices / seconds, 'failed': failed_hosts(app, workflow),
+                'peak_rss_mb': max_rss_mb(), 'rss_growth_mb': max_rss_mb() - rss_before}
+
+
+def child(args):
+    profile = MockProfile(**json.loads(args.child_profile))
+    print(json.dumps(asyncio.run(run_workflow(args.child, args.child_hosts, profile))))
+
+
+def write_config(work_dir, workers):
+    """Lets the runner go up to workers hosts at once, and keeps the runs from hitting the default deadline"""
+    path = os.path.join(work_dir, 'norn_inv', 'config.yaml')
+    with open(path, 'r') as f:
+        config = yaml.safe_load(f)
+    config['runner']['options'].update(num_workers=workers, max_workers=workers, deadline=3600)
+    with open(path, 'w') as f:
+        yaml.safe_dump(config, f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--hosts', default='10,1000,10000', help='comma separated inventory sizes')
+    parser.add_argument('--workflows', default=','.join(WORKFLOWS))
+    parser.add_argument('--workers', type=int, default=50, help='max hosts the runner runs at once')
+    parser.add_argument('--timeout', type=float, default=1800, help='seconds before giving up on a run')
+    parser.add_argument('--json', help='file to write the results to, one JSON line per run')
+    for field in fields(MockProfile):
+        parser.add_argument(f"--{field.name.replace('_', '-')}", type=type(field.default), default=field.default)
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--child-hosts', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--child-profile', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        return child(args)
+
+    profile = json.dumps({field.name: getattr(args, field.name) for field in fields(MockProfile)})
+    results = []
+    print(f"{'hosts':>6} {'workflow':<16}{'seconds':>9}{'hosts/s':>10}{'failed':>8}{'peak MB':>9}{'growth MB':>11}")
+    for hosts in [int(hosts) for hosts in args.hosts.split(',')]:
+        with tempfile.TemporaryDirectory() as work_dir:
+            make_inventory(work_dir, hosts)
+            write_config(work_dir, args.workers)
+            env = dict(os.environ, PYTHONPATH=os.pathsep.join([REPO_DIR, BENCHMARKS_DIR]))
+            for workflow in args.workflows.split(','):
+                shutil.rmtree(os.path.join(work_dir, '.net_tui_cache'), ignore_errors=True)
+                try:
+                    run = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', workflow,
+                                          '--child-hosts', str(hosts), '--child-profile', profile],
+                                         cwd=work_dir, env=env, capture_output=True, text=True, timeout=args.timeout)
+                except subprocess.TimeoutExpired:
+                    print(f'{hosts:>6} {workflow:<16}timed out after {args.timeout:.0f}s', flush=True)
+                    continue
+                if run.returncode:
+                    print(f'{hosts:>6} {workflow:<16}failed\n{run.stderr[-2000:]}')
+                    continue
+                result = json.loads(run.stdout.strip().splitlines()[-1])
+                results.append(result)
+                failed = '-' if result['failed'] is None else result['failed']
+                print(f"{hosts:>6} {workflow:<16}{result['seconds']:>9.2f}{result['hosts_per_second']:>10.1f}"
+                      f"{failed:>8}{result['peak_rss_mb']:>9.0f}{result['rss_growth_mb']:>11.0f}", flush=True)
+    if args.json:
+        with open(args.json, 'w') as f:
+            for result in results:
+                f.write(json.dumps(result) + '\n')
+
+
+if __name__ == '__main__':
+    main()
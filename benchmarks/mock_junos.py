@@ -0,0 +1,200 @@
+"""
+Stand-in Junos devices for the benchmarks, replaying the RPC replies and CLI outputs recorded
+from a real device (benchmarks/recordings/*.json) through the pyez and napalm connection
+plugins, with the latency, jitter, failures and output sizes of a MockProfile. Every host gets
+its own seeded random stream, so a run can be replayed exactly.
+
+    mock_junos.install(MockProfile(latency=0.05, jitter=0.02, failure_rate=0.01))
+
+A recording can be taken from a real device with record(), e.g.
+
+    from jnpr.junos import Device
+    with Device(host='mx1', user='lab', password='lab') as device:
+        mock_junos.record(device, 'benchmarks/recordings/mx1.json', ['show version', 'show bgp summary'])
+"""
+import json
+import os
+import random
+import re
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+
+from lxml import etree
+
+RECORDINGS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'recordings')
+
+
+@dataclass
+class MockProfile:
+    latency: float = 0.05  # seconds per RPC/CLI call
+    jitter: float = 0.02  # +/- seconds added to the latency
+    connect_latency: float = 0.2
+    bandwidth: float = 10.0 * 1024 * 1024  # bytes/s, replies take len(reply) / bandwidth longer
+    failure_rate: float = 0.0  # fraction of the RPC/CLI calls failing
+    down_rate: float = 0.0  # fraction of the hosts refusing connections
+    slow_rate: float = 0.0  # fraction of the hosts slow_factor times slower
+    slow_factor: float = 10.0
+    cli_bytes: int = 0  # CLI outputs are repeated up to this size, 0 keeps the recorded size
+    config_bytes: int = 0  # configs are padded up to this size with per host interface lines
+    seed: int = 0
+    recording: str = os.path.join(RECORDINGS_DIR, 'mx480.json')
+
+
+class MockRpcError(Exception):
+    pass
+
+
+def host_fraction(hostname, seed, salt):
+    """Deterministic number in [0, 1) for the host, to pick the down and slow hosts"""
+    return zlib.crc32(f'{seed}:{salt}:{hostname}'.encode()) / 2 ** 32
+
+
+def remote_filter(output, command):
+    """Applies the '| match/except/count' pipes of the command, like the device would"""
+    for pipe in command.split(' | ')[1:]:
+        action, _, argument = pipe.partition(' ')
+        argument = argument.strip().strip('"')
+        if action == 'match':
+            output = ''.join(line for line in output.splitlines(True) if re.search(argument, line))
+        elif action == 'except':
+            output = ''.join(line for line in output.splitlines(True) if not re.search(argument, line))
+        elif action == 'count':
+            output = f'Count: {len(output.splitlines())} lines\n'
+    return output
+
+
+class MockDevice:
+    """Replays the recording as one host, standing in for both the pyez Device and the napalm driver"""
+
+    def __init__(self, hostname, profile, recording):
+        self.hostname = hostname
+        self.profile = profile
+        self.recording = recording
+        self.random = random.Random(zlib.crc32(f'{profile.seed}:{hostname}'.encode()))
+        self.random_lock = threading.Lock()
+        self.factor = profile.slow_factor if host_fraction(hostname, profile.seed, 'slow') < profile.slow_rate else 1
+        self.connected = True
+        self.facts = recording['facts']
+        self.rpc = MockRpc(self)
+        # napalm driver.device, the pyez Device the driver is built on
+        self.device = self
+
+    def reply(self, name, payload):
+        """Waits as long as the device would take to send the payload back, failing failure_rate of the calls"""
+        with self.random_lock:
+            jitter = self.random.uniform(-self.profile.jitter, self.profile.jitter)
+            failed = self.random.random() < self.profile.failure_rate
+        time.sleep(max(0.0, self.profile.latency * self.factor + jitter) + len(payload) / self.profile.bandwidth)
+        if failed:
+            raise MockRpcError(f'{self.hostname}: {name} timed out')
+        return payload
+
+    def output(self, command):
+        base, _, _ = command.partition(' | ')
+        if base == 'show configuration' or base.startswith('show configuration '):
+            output = self.config()
+        else:
+            output = self.recording['cli'].get(base, f'{base}\n{self.hostname} output line\n').replace(
+                '{host}', self.hostname)
+            if self.profile.cli_bytes and output:
+                output = output * (self.profile.cli_bytes // len(output) + 1)
+                output = output[:self.profile.cli_bytes]
+        return remote_filter(output, command)
+
+    def config(self):
+        config = self.recording['cli']['show configuration | display set'].replace('{host}', self.hostname)
+        lines = [config]
+        size = len(config)
+        unit = 0
+        while size < self.profile.config_bytes:
+            port = f'{unit // 4000}/{unit // 40 % 100}/{unit % 40}'
+            line = f'set interfaces ge-{port} description "{self.hostname} port {unit}"\n'
+            lines.append(line)
+            size += len(line)
+            unit += 1
+        return ''.join(lines)
+
+    def cli(self, commands, warning=True, format='text'):
+        """
+        pyez Device cli() for a command, napalm driver cli() for a list of them. The latter is
+        the real driver's, so the pipes get napalm's handling, as against a device.
+        """
+        if isinstance(commands, list):
+            from napalm.junos.junos import JunOSDriver
+            return JunOSDriver.cli(self, commands)
+        return self.reply('cli', self.output(commands))
+
+    def is_alive(self):
+        return {'is_alive': self.connected}
+
+    def close(self):
+        self.connected = False
+
+
+class MockRpc:
+    """pyez device.rpc, every <rpc>(filter_xml=...) call replays the recorded reply"""
+
+    def __init__(self, device):
+        self.device = device
+
+    def get_config(self, filter_xml=None, options=None):
+        return etree.fromstring(self.device.reply('get-config', self.device.recording['rpc']['get-config']))
+
+    def __getattr__(self, name):
+        rpc = name.replace('_', '-')
+        if rpc not in self.device.recording['rpc']:
+            raise AttributeError(name)
+
+        def call(filter_xml=None, **kwargs):
+            return etree.fromstring(self.device.reply(rpc, self.device.recording['rpc'][rpc]))
+        return call
+
+
+class MockConnection:
+    """nornir connection plugin opening a MockDevice, registered as both pyez and napalm by install()"""
+    profile = MockProfile()
+    recording = None
+
+    def open(self, hostname, username, password, port, platform, extras=None, configuration=None):
+        profile = MockConnection.profile
+        time.sleep(profile.connect_latency)
+        if host_fraction(hostname, profile.seed, 'down') < profile.down_rate:
+            raise ConnectionRefusedError(f'{hostname}: connection refused')
+        self.connection = MockDevice(hostname, profile, MockConnection.recording)
+
+    def close(self):
+        self.connection.close()
+
+
+def install(profile):
+    """
+    Makes the pyez and napalm connections of every host a MockDevice with the profile. Has to be
+    called once nornir is initialised, as InitNornir registers the real connection plugins.
+    """
+    from nornir.core.plugins.connections import ConnectionPluginRegister
+
+    with open(profile.recording, 'r') as f:
+        MockConnection.recording = json.load(f)
+    MockConnection.profile = profile
+    ConnectionPluginRegister.available['pyez'] = MockConnection
+    ConnectionPluginRegister.available['napalm'] = MockConnection
+
+
+def record(device, path, commands):
+    """Records the replies of the RPCs net_tui runs, and the output of the commands, from a pyez device"""
+    from rpc_models import RPC_PARSERS
+
+    recording = {'facts': {key: device.facts.get(key) for key in ('version', 'model', 'serialnumber', 'RE0', 'RE1')},
+                 'rpc': {}, 'cli': {}}
+    for rpc in list(RPC_PARSERS) + ['get-system-uptime-information']:
+        try:
+            recording['rpc'][rpc] = etree.tostring(getattr(device.rpc, rpc.replace('-', '_'))()).decode()
+        except Exception as exc:
+            print(f'{rpc} not recorded: {exc}')
+    recording['rpc']['get-config'] = etree.tostring(device.rpc.get_config(filter_xml='<protocols/>')).decode()
+    for command in commands + ['show configuration | display set']:
+        recording['cli'][command] = device.rpc.cli(command, format='text').text or ''
+    with open(path, 'w') as f:
+        json.dump(recording, f, indent=1)
@@ -0,0 +1,84 @@
+"""
+Start up benchmark, measures how long net_tui takes to import, to paint the first screen and
+to finish loading the inventory, against a generated inventory of --hosts devices.
+Exits non zero if the first paint goes over --budget seconds.
+
+    python benchmarks/startup.py --hosts 20000 --budget 2.5
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Run in a fresh interpreter, so the imports are measured cold
+MEASURE = '''
+import asyncio, json, time
+start = time.perf_counter()
+import net_tui
+imported = time.perf_counter() - start
+# Only the start up is measured, nothing is sent to the devices
+net_tui.ConnectionPool.start = lambda self: None
+net_tui.NetTUI.hw_index_refresh = lambda self, *args, **kwargs: None
+timings = {'import': imported}
+on_mount = net_tui.NetTUI.on_mount
+
+
+def timed_mount(self):
+    on_mount(self)
+    self.call_after_refresh(lambda: timings.setdefault('first_paint', time.perf_counter() - start))
+
+
+net_tui.NetTUI.on_mount = timed_mount
+
+
+async def main():
+    app = net_tui.NetTUI()
+    async with app.run_test(size=(200, 60)):
+        while app.sub_title == 'loading inventory':
+            await asyncio.sleep(0.01)
+        timings['inventory_loaded'] = time.perf_counter() - start
+    print(json.dumps(timings))
+
+asyncio.run(main())
+'''
+
+
+def make_inventory(work_dir, hosts):
+    os.makedirs(os.path.join(work_dir, 'norn_inv'))
+    for name in ('config.yaml', 'groups.yaml'):
+        shutil.copy(os.path.join(REPO_DIR, 'norn_inv', name), os.path.join(work_dir, 'norn_inv', name))
+    for name in ('card_inventory.txt', 'cli_commands.txt', 'cmds.yml'):
+        shutil.copy(os.path.join(REPO_DIR, name), os.path.join(work_dir, name))
+    with open(os.path.join(work_dir, 'norn_inv', 'hosts.yaml'), 'w') as f:
+        f.write('---\n')
+        for i in range(hosts):
+            f.write(f'R{i}:\n  hostname: 10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}\n  port: 22\n'
+                    f'  groups:\n    - nos\n  data:\n    site: R{i}\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--hosts', type=int, default=20000)
+    parser.add_argument('--budget', type=float, default=2.5, help='first paint budget in seconds')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        make_inventory(work_dir, args.hosts)
+        env = dict(os.environ, PYTHONPATH=REPO_DIR)
+        output = subprocess.run([sys.executable, '-c', MEASURE], cwd=work_dir, env=env, check=True,
+                                capture_output=True, text=True).stdout
+    timings = json.loads(output.strip().splitlines()[-1])
+    for name, seconds in timings.items():
+        print(f'{name:<18}{seconds:.2f}s')
+    if timings['first_paint'] > args.budget:
+        print(f'first paint over the {args.budget:.2f}s budget')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+import hashlib
+import re
+from difflib import SequenceMatcher
+
+from net_store import read_json, write_json
+
+# Fields which change between any two runs of a command, replaced before the outputs are compared
+NOISE_PATTERNS = [
+    (re.compile(r'\b\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}:\d{2}(\.\d+)?( [A-Z]{2,5})?'), '<time>'),
+    (re.compile(r'(?<![\w:])(\d+w)?(\d+d)? ?\d{1,2}:\d{2}(:\d{2})?(?![\w:])'), '<time>'),
+    (re.compile(r'\b(\d+[wdhms]){2,}\b'), '<time>'),
+    # Traffic counters, not the errors and drops, which are what the checks are after
+    (re.compile(r'(?i)\b(packets|bytes|octets|messages|updates|input|output)(\W+)\d+'), r'\1\2<n>'),
+    # Rates, e.g. 'Input rate     : 1024 bps (2 pps)'
+    (re.compile(r'(?i)\b\d+( [kmg]?bps| pps)\b'), r'<n>\1'),
+    # show bgp summary InPkt and OutPkt columns of the peer lines
+    (re.compile(r'^([\d.:a-fA-F]+\s+\d+\s+)\d+(\s+)\d+\b'), r'\1<n>\2<n>'),
+    # show ospf neighbor Dead column
+    (re.compile(r'\b(Full|2Way|Init|ExStart|Exchange|Loading|Attempt|Down)(\s+\S+\s+\d+\s+)\d+(?=\s*$)'),
+     r'\1\2<n>'),
+    # Column alignment, which shifts as the width of the values changes
+    (re.compile(r'\s+'), ' '),
+]
+
+
+def normalize(line):
+    for pattern, replacement in NOISE_PATTERNS:
+        line = pattern.sub(replacement, line)
+    return line.rstrip()
+
+
+def section_header(command):
+    return f'**** {command} ****\n'
+
+
+def write_snapshot(path, outputs):
+    """
+    Writes the {command: output} of a device to path, along with a path.json index of the
+    byte range and the digest of the normalized output of each command
+    """
+    index = {}
+    with open(path, 'wb') as f:
+        for command, output in outputs.items():
+            f.write(section_header(command).encode())
+            start = f.tell()
+            data = output if output.endswith('\n') else output + '\n'
+            f.write(data.encode())
+            digest = hashlib.sha1()
+            for line_no, line in enumerate(data.splitlines()):
+                digest.update(f'\n{normalize(line)}'.encode() if line_no else normalize(line).encode())
+            index[command] = [start, f.tell(), digest.hexdigest()]
+    write_json(f'{path}.json', index)
+
+
+def section_lines(path, start, end):
+    """Yields the lines of the byte range of the snapshot, reading them one at a time"""
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = end - start
+        for line in f:
+            if remaining <= 0:
+                break
+            line = line[:remaining]
+            remaining -= len(line)
+            yield line.decode(errors='replace').rstrip('\r\n')
+
+
+def picked_lines(path, start, end, line_nos):
+    """Returns {line number: line} of the lines of the byte range in line_nos"""
+    return {line_no: line for line_no, line in enumerate(section_lines(path, start, end)) if line_no in line_nos}
+
+
+def diff_snapshots(pre_path, post_path, context=1):
+    """
+    Yields the diff lines of the post snapshot against the pre one, command by command. Commands
+    whose normalized output is unchanged are skipped on their digest. The others are compared
+    on the hashes of their normalized lines, and only the lines making up the diff are read
+    back, so neither output is ever held in full.
+    """
+    pre_index = read_json(f'{pre_path}.json')
+    post_index = read_json(f'{post_path}.json')
+    for command, (start, end, digest) in post_index.items():
+        if command not in pre_index:
+            yield f'+++ {command} (not in pre checks)'
+            continue
+        pre_start, pre_end, pre_digest = pre_index[command]
+        if digest == pre_digest:
+            continue
+        matcher = SequenceMatcher(None, [hash(normalize(line)) for line in section_lines(pre_path, pre_start, pre_end)],
+                                  [hash(normalize(line)) for line in section_lines(post_path, start, end)],
+                                  autojunk=False)
+        # Snapshots written by older pattern sets can differ on the digest only
+        groups = [group for group in matcher.get_grouped_opcodes(context)
+                  if any(tag != 'equal' for tag, _, _, _, _ in group)]
+        if not groups:
+            continue
+        pre_lines = picked_lines(pre_path, pre_start, pre_end, {
+            line_no for group in groups for _, pre_from, pre_to, _, _ in group for line_no in range(pre_from, pre_to)})
+        post_lines = picked_lines(post_path, start, end, {
+            line_no for group in groups for tag, _, _, post_from, post_to in group if tag != 'equal'
+            for line_no in range(post_from, post_to)})
+        yield f'@@@ {command}'
+        for group in groups:
+            for tag, pre_from, pre_to, post_from, post_to in group:
+                if tag == 'equal':
+                    for line_no in range(pre_from, pre_to):
+                        yield f'  {pre_lines[line_no]}'
+                    continue
+                for line_no in range(pre_from, pre_to):
+                    yield f'- {pre_lines[line_no]}'
+                for line_no in range(post_from, post_to):
+                    yield f'+ {post_lines[line_no]}'
+    for command in pre_index:
+        if command not in post_index:
+            yield f'--- {command} (not in post checks)'
@@ -0,0 +1,183 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from net_store import read_json, write_json
+
+
+def is_alive(host, connection):
+    """Health check of an open connection, the RPC also keeps the NETCONF session active"""
+    conn = host.connections[connection].connection
+    try:
+        if connection == 'pyez':
+            conn.rpc.get_system_uptime_information()
+            return conn.connected
+        if connection == 'napalm':
+            conn.device.rpc.get_system_uptime_information()
+            return conn.is_alive()['is_alive']
+    except Exception:
+        return False
+    return True
+
+
+class SaxNapalm:
+    """
+    nornir napalm connection plugin, same as nornir_napalm's except the pyez Device under the
+    junos driver is opened with use_filter. ncclient then parses the replies of the RPCs run
+    with a filter_xml with its SAX parser, keeping only the elements of the filter as the reply
+    streams in, instead of building the full tree. Other replies are parsed as usual.
+    """
+
+    def open(self, hostname, username, password, port, platform, extras=None, configuration=None):
+        from napalm import get_network_driver
+
+        parameters = {'hostname': hostname, 'username': username, 'password': password, 'optional_args': {}}
+        try:
+            parameters['optional_args']['ssh_config_file'] = configuration.ssh.config_file
+        except AttributeError:
+            pass
+        parameters.update(extras or {})
+        if port and 'port' not in parameters['optional_args']:
+            parameters['optional_args']['port'] = port
+        connection = get_network_driver(platform)(**parameters)
+        if hasattr(connection, 'device'):
+            # Read by Device.open(), napalm doesn't pass it on from the optional args
+            connection.device._use_filter = True
+        connection.open()
+        self.connection = connection
+
+    def close(self):
+        self.connection.close()
+
+
+class ConnectionPool:
+    """
+    Nornir processor which manages the napalm connections the tasks leave open on the
+    hosts. Connections idle for keepalive seconds are health checked in the background and
+    closed if dead, so the next task reopens them instead of hanging on a stale session.
+    Connections idle for idle_timeout seconds are closed, and at most max_per_host tasks use
+    the session of a host at once, the others wait for their turn. The most used hosts are
+    connected in the background on start up, so the first Checker/Dashboard action doesn't pay
+    the session setup cost.
+    """
+
+    def __init__(self, nornir_obj, cache_dir, keepalive=60, idle_timeout=900, max_per_host=2, warm_hosts=20,
+                 num_workers=10):
+        self.nr = nornir_obj
+        self.usage_path = os.path.join(cache_dir, 'pool_usage.json')
+        os.makedirs(cache_dir, exist_ok=True)
+        # {host: {connection: times used}}, persisted to pick the hosts to warm up
+        self.usage = read_json(self.usage_path)
+        self.keepalive = keepalive
+        self.idle_timeout = idle_timeout
+        self.max_per_host = max_per_host
+        self.warm_hosts = warm_hosts
+        self.num_workers = num_workers
+        self.last_used = {}  # (host, connection) -> epoch
+        self.busy = {}  # host -> number of tasks running on the host
+        self.slots = {}  # host -> semaphore of the tasks allowed on the host at once
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+
+    def task_started(self, task):
+        pass
+
+    def task_completed(self, task, result):
+        pass
+
+    def task_instance_started(self, task, host):
+        with self.lock:
+            slots = self.slots.setdefault(host.name, threading.BoundedSemaphore(self.max_per_host))
+        slots.acquire()
+        with self.lock:
+            self.busy[host.name] = self.busy.get(host.name, 0) + 1
+            first = self.busy[host.name] == 1
+        # Checking connections which have been idle for a while before the task uses them
+        for connection in list(host.connections):
+            if first and time.time() - self.last_used.get((host.name, connection), 0) > self.keepalive:
+                if not is_alive(host, connection):
+                    self.close(host, connection)
+
+    def task_instance_completed(self, task, host, result):
+        now = time.time()
+        with self.lock:
+            self.busy[host.name] -= 1
+            host_usage = self.usage.setdefault(host.name, {})
+            for connection in host.connections:
+                self.last_used[(host.name, connection)] = now
+                host_usage[connection] = host_usage.get(connection, 0) + 1
+        self.slots[host.name].release()
+
+    def subtask_instance_started(self, task, host):
+        pass
+
+    def subtask_instance_completed(self, task, host, result):
+        pass
+
+    def close(self, host, connection):
+        try:
+            host.close_connection(connection)
+        except Exception:
+            host.connections.pop(connection, None)
+        self.last_used.pop((host.name, connection), None)
+
+    def warm_up(self):
+        """Opens the connections of the most used hosts"""
+        ranked = sorted(self.usage, key=lambda name: -sum(self.usage[name].values()))
+        hosts = [self.nr.inventory.hosts[name] for name in ranked[:self.warm_hosts] if name in self.nr.inventory.hosts]
+
+        def connect(host):
+            for connection in self.usage[host.name]:
+                with self.lock:
+                    if self.busy.get(host.name) or connection in host.connections:
+                        continue
+                try:
+                    host.get_connection(connection, self.nr.config)
+                    self.last_used[(host.name, connection)] = time.time()
+                except Exception:
+                    host.connections.pop(connection, None)
+
+        with ThreadPoolExecutor(max_workers=self.num_workers) as executor:
+            list(executor.map(connect, hosts))
+
+    def maintain(self):
+        """Closes the idle connections and health checks the ones idle for more than keepalive seconds"""
+        now = time.time()
+        to_check = []
+        with self.lock:
+            for (name, connection), last_used in list(self.last_used.items()):
+                host = self.nr.inventory.hosts[name]
+                if self.busy.get(name) or connection not in host.connections:
+                    continue
+                if now - last_used > self.idle_timeout:
+                    self.close(host, connection)
+                elif now - last_used > self.keepalive:
+                    to_check.append((host, connection))
+
+        def check(host_connection):
+            host, connection = host_connection
+            if not is_alive(host, connection):
+                with self.lock:
+                    if not self.busy.get(host.name):
+                        self.close(host, connection)
+
+        with ThreadPoolExecutor(max_workers=self.num_workers) as executor:
+            list(executor.map(check, to_check))
+        with self.lock:
+            write_json(self.usage_path, self.usage)
+
+    def start(self):
+        """Warms up the most used hosts, then keeps maintaining the connections in the background"""
+        def run():
+            self.warm_up()
+            while not self.stopped.wait(self.keepalive):
+                self.maintain()
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def stop(self):
+        self.stopped.set()
+        with self.lock:
+            write_json(self.usage_path, self.usage)
+        self.nr.close_connections(on_good=True, on_failed=True)
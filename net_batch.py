@@ -0,0 +1,201 @@
+"""
+Headless batch mode, runs the net_tui lookups across the devices without the terminal UI and
+streams one JSON record per device to stdout (or --output) as soon as the device is done.
+
+    python net_batch.py card <model number> [--targets group:core] [--workers 50]
+    python net_batch.py config <regex>
+    python net_batch.py cmds "show version,show bgp summary" [--remote-filter "except Established"]
+    python net_batch.py checks terse|verbose
+    python net_batch.py dashboard --trace dashboard_trace.json
+
+Every record has the device name and its status (ok, failed, timed_out, skipped, cancelled),
+failed devices carry the error. Outputs are dropped as soon as their record is written, so the
+memory used doesn't grow with the output of the fleet.
+
+Exit codes: 0 all devices ok, 1 some devices failed, 3 every device failed or none matched
+the targets (2 is argparse's usage error).
+"""
+import argparse
+import json
+import sys
+import threading
+from dataclasses import asdict, is_dataclass
+
+import net_tui
+from net_store import line_matcher
+from scheduler import AdaptiveRunner, CircuitOpen, HostTimeout, RunCancelled
+
+EXIT_OK = 0
+EXIT_PARTIAL = 1
+EXIT_FAILED = 3
+
+
+def host_status(multi_result):
+    if not multi_result.failed:
+        return 'ok'
+    exception = multi_result[0].exception
+    if isinstance(exception, HostTimeout):
+        return 'timed_out'
+    if isinstance(exception, CircuitOpen):
+        return 'skipped'
+    if isinstance(exception, RunCancelled):
+        return 'cancelled'
+    return 'failed'
+
+
+def to_json(value):
+    """json default, for the rpc models and the exceptions in the dashboard data"""
+    if is_dataclass(value):
+        return asdict(value)
+    if isinstance(value, (set, tuple)):
+        return list(value)
+    return str(value)
+
+
+def search_lines(config, cfg_search):
+    """Returns the config lines matching the regex cfg_search, same as ConfigIndex.search for one device"""
+    _, matches = line_matcher(cfg_search)
+    return [line for line in config.splitlines() if line and matches(line)]
+
+
+def card_record(router, result, card_name):
+    modules = result[0].result
+    net_tui.hw_index.update(router, [[module.model, module.slot_path, module.serial] for module in modules])
+    return {'matches': [{'slot': module.slot_path, 'serial': module.serial}
+                        for module in modules if module.model == card_name]}
+
+
+def config_record(router, result, cfg_search):
+    return {'matches': search_lines(result[0].result, cfg_search)}
+
+
+def cmds_record(router, result, commands):
+    outputs = result[0].result
+    net_tui.archive.put_many(router, outputs, 'batch')
+    return {'outputs': {command: outputs[command] for command in commands}}
+
+
+def checks_record(router, result, all_cmds, level):
+    protocols = result[0].result['protocols']
+    commands, protocols_na = net_tui.check_commands(all_cmds, protocols, level)
+    return {'protocols': protocols, 'commands': commands, 'protocols_na': protocols_na}
+
+
+def dashboard_record(router, result):
+    panel_data = result[0].result['data']
+    return {'summary': net_tui.health_summary(panel_data), 'latency': result[0].result['latency'],
+            'errors': {name: str(data) for name, data in panel_data.items() if isinstance(data, Exception)}}
+
+
+def cached_config_record(router, cfg_search):
+    """Unreachable devices are still searched using their cached config, like the Checker does"""
+    config = net_tui.cfg_cache.get(router)
+    if config is None:
+        return {}
+    return {'matches': search_lines(config, cfg_search), 'cached': True}
+
+
+def batch_job(args):
+    """Returns (task kwargs, record function(router, result)) for the batch command"""
+    if args.command == 'card':
+        return {'task': net_tui.chassis_task}, lambda router, result: card_record(router, result, args.query)
+    if args.command == 'config':
+        return {'task': net_tui.config_task}, lambda router, result: config_record(router, result, args.query)
+    if args.command == 'cmds':
+        pipe = net_tui.remote_pipe(args.remote_filter)
+        commands = [cmd.strip() + pipe for cmd in args.query.split(',') if cmd.strip()]
+        return {'task': net_tui.cli_task, 'commands': commands}, \
+            lambda router, result: cmds_record(router, result, commands)
+    if args.command == 'checks':
+        all_cmds = net_tui.load_check_cmds()
+        return {'task': net_tui.protocols_task}, \
+            lambda router, result: checks_record(router, result, all_cmds, args.query)
+    return {'task': net_tui.main_task}, dashboard_record
+
+
+def run_batch(args, out):
+    """Runs the batch command, writing a record per device to out, returns the exit code"""
+    net_tui.load_inventory()
+    target_nr = net_tui.target_nornir(args.targets) if args.targets else net_tui.nr
+    if not target_nr.inventory.hosts:
+        print(f'No devices matching {args.targets}', file=sys.stderr)
+        return EXIT_FAILED
+    runner_options = dict(net_tui.nornir_config.get('runner', {}).get('options', {}))
+    if args.workers:
+        runner_options.update(num_workers=args.workers, max_workers=args.workers,
+                              min_workers=min(args.workers, runner_options.get('min_workers', 2)))
+    if args.host_timeout:
+        runner_options['host_timeout'] = args.host_timeout
+    target_nr = target_nr.with_runner(AdaptiveRunner(**runner_options))
+    task_kwargs, make_record = batch_job(args)
+    counts = {'ok': 0, 'failed': 0}
+    write_lock = threading.Lock()
+
+    def host_done(router, result):
+        record = {'device': router, 'command': args.command, 'status': host_status(result)}
+        if result.failed:
+            record['error'] = str(result[0].exception or result[0].result)
+            if args.command == 'config':
+                record.update(cached_config_record(router, args.query))
+        else:
+            try:
+                record.update(make_record(router, result))
+            except Exception as exc:
+                record.update(status='failed', error=f'{type(exc).__name__}: {exc}')
+        line = json.dumps(record, default=to_json)
+        with write_lock:
+            counts['ok' if record['status'] == 'ok' else 'failed'] += 1
+            out.write(line + '\n')
+            out.flush()
+        # Results are kept by the run until it's over, dropping the outputs once they are written out
+        for host_result in result:
+            host_result.result = None
+
+    try:
+        net_tui.stream_run(target_nr, host_done, **task_kwargs)
+    finally:
+        if args.command == 'card':
+            net_tui.hw_index.save()
+        net_tui.transfer_stats.save()
+        net_tui.pool.stop()
+        if args.trace:
+            net_tui.tracer.export(args.trace)
+    print(f"{counts['ok']} devices ok, {counts['failed']} failed", file=sys.stderr)
+    if not counts['failed']:
+        return EXIT_OK
+    return EXIT_PARTIAL if counts['ok'] else EXIT_FAILED
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Runs the net_tui lookups headless, one JSON line per device')
+    parser.add_argument('command', choices=('card', 'config', 'cmds', 'checks', 'dashboard'))
+    parser.add_argument('query', nargs='?', default='',
+                        help='card model number, config regex, comma separated commands or the checks level')
+    parser.add_argument('--targets', default='', help='comma separated devices or group:<name>, default all')
+    parser.add_argument('--workers', type=int, help='devices run at once, default the runner options')
+    parser.add_argument('--host-timeout', type=float, help='seconds before giving up on a device')
+    parser.add_argument('--remote-filter', default='', help="filter applied on the device to 'cmds' outputs")
+    parser.add_argument('--output', help='file to write the records to, default stdout')
+    parser.add_argument('--trace', help='file to export the Chrome trace of the run to')
+    args = parser.parse_args(argv)
+    if args.command == 'checks' and args.query not in ('terse', 'verbose'):
+        parser.error("checks level has to be 'terse' or 'verbose'")
+    if args.command in ('card', 'config', 'cmds') and not args.query.strip():
+        parser.error(f'{args.command} needs a query')
+    try:
+        net_tui.remote_pipe(args.remote_filter)
+    except ValueError as exc:
+        parser.error(str(exc))
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not args.output:
+        return run_batch(args, sys.stdout)
+    with open(args.output, 'w') as out:
+        return run_batch(args, out)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
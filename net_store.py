@@ -0,0 +1,604 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+import heapq
+from bisect import bisect_left, insort
+from collections import deque
+from itertools import islice
+
+
+def safe_name(name):
+    """Returns a name which can be used as a file name"""
+    return re.sub(r'[^\w.-]', '_', name)
+
+
+def write_json(path, data):
+    """Writes the json file atomically, so that a crash never leaves a half written index behind"""
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def read_json(path):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+class ConfigCache:
+    """
+    On disk store of the set format config of each device, keyed by the device name and
+    valid only as long as the last commit time on the device matches the one the config
+    was fetched with. Least recently used configs are evicted once the store grows beyond
+    max_bytes or max_devices.
+    """
+
+    def __init__(self, cache_dir, max_bytes=200 * 1024 * 1024, max_devices=5000):
+        self.cache_dir = os.path.join(cache_dir, 'configs')
+        self.index_path = os.path.join(self.cache_dir, 'index.json')
+        self.max_bytes = max_bytes
+        self.max_devices = max_devices
+        self.lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # {device: {'commit': commit time, 'size': bytes, 'used': last used epoch}}
+        self.index = read_json(self.index_path)
+
+    def path(self, device):
+        return os.path.join(self.cache_dir, f'{safe_name(device)}.set')
+
+    def get(self, device, commit_time=None):
+        """
+        Returns the cached config of the device, or None if it's not cached or the device
+        has been committed since. Passing no commit_time returns whatever is cached.
+        """
+        with self.lock:
+            entry = self.index.get(device)
+            if not entry or (commit_time is not None and entry['commit'] != commit_time):
+                return None
+            try:
+                with open(self.path(device), 'r') as f:
+                    config = f.read()
+            except OSError:
+                self.index.pop(device)
+                return None
+            entry['used'] = time.time()
+            return config
+
+    def commit_time(self, device):
+        entry = self.index.get(device)
+        return entry['commit'] if entry else None
+
+    def put(self, device, commit_time, config):
+        with self.lock:
+            with open(self.path(device), 'w') as f:
+                f.write(config)
+            self.index[device] = {'commit': commit_time, 'size': len(config.encode()), 'used': time.time()}
+            self.evict()
+            write_json(self.index_path, self.index)
+
+    def devices(self):
+        return list(self.index.keys())
+
+    def evict(self):
+        """Drops the least recently used configs until the store is within its bounds"""
+        total = sum(entry['size'] for entry in self.index.values())
+        for device in sorted(self.index, key=lambda name: self.index[name]['used']):
+            if total <= self.max_bytes and len(self.index) <= self.max_devices:
+                break
+            total -= self.index.pop(device)['size']
+            try:
+                os.remove(self.path(device))
+            except OSError:
+                pass
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def required_literals(pattern):
+    """
+    Returns the literal strings which every match of the regex pattern has to contain,
+    an empty list means the pattern has no usable literals (alternation, too short...)
+    """
+    literals = []
+    current = ''
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == '\\':
+            literals.append(current)
+            current = ''
+            i += 2
+            continue
+        if char == '|':
+            return []
+        if char in '*?{':
+            # Preceding char is optional
+            current = current[:-1]
+            literals.append(current)
+            current = ''
+            if char == '{':
+                i = pattern.find('}', i) if '}' in pattern[i:] else len(pattern)
+        elif char == '[':
+            literals.append(current)
+            current = ''
+            # A ']' right after the '[' or '[^' is part of the class, not its end
+            i += 2 if pattern[i + 1:i + 2] == '^' else 1
+            if pattern[i:i + 1] == ']':
+                i += 1
+            while i < len(pattern) and pattern[i] != ']':
+                i += 2 if pattern[i] == '\\' else 1
+        elif char == '(':
+            # Group could be optional or have alternations, skip it
+            literals.append(current)
+            current = ''
+            depth = 0
+            while i < len(pattern):
+                if pattern[i] == '\\':
+                    i += 1
+                elif pattern[i] == '(':
+                    depth += 1
+                elif pattern[i] == ')':
+                    depth -= 1
+                    if depth == 0:
+                        break
+                i += 1
+        elif char in '.^$+)':
+            literals.append(current)
+            current = ''
+        else:
+            current += char
+        i += 1
+    literals.append(current)
+    return [literal for literal in literals if len(literal) >= 3]
+
+
+def human_bytes(size):
+    for unit in ('B', 'KB', 'MB'):
+        if size < 1024:
+            return f'{size:.0f} {unit}' if unit == 'B' else f'{size:.1f} {unit}'
+        size /= 1024
+    return f'{size:.1f} GB'
+
+
+def line_matcher(cfg_search):
+    """
+    Returns (literals, matches(line)) for the config search cfg_search, a regex matched case
+    insensitively like '| match' on the device, or a plain substring if it isn't a valid regex.
+    literals are the lower cased strings every matching line contains.
+    """
+    try:
+        pattern = re.compile(cfg_search, re.IGNORECASE)
+        # Inline flags other than (?i), (?x) and the like, change what the literals match
+        literals = required_literals(cfg_search) if not pattern.flags & ~(re.UNICODE | re.IGNORECASE) else []
+        return [literal.lower() for literal in literals], pattern.search
+    except re.error:
+        cfg_search = cfg_search.lower()
+
+        def matches(line):
+            return cfg_search in line.lower()
+        return [cfg_search], matches
+
+
+class TransferStats:
+    """
+    Size of the last unfiltered reply of each query per device, which the replies filtered
+    on the device are compared against to report the bytes saved
+    """
+
+    def __init__(self, cache_dir):
+        self.path = os.path.join(cache_dir, 'transfer.json')
+        self.lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        # {query: {device: bytes of the unfiltered reply}}
+        self.baseline = read_json(self.path)
+
+    def record(self, query, device, received, filtered=True):
+        """
+        Records a reply of received bytes, returns the bytes saved by the filter, 0 if the
+        unfiltered size isn't known
+        """
+        with self.lock:
+            if not filtered:
+                self.baseline.setdefault(query, {})[device] = received
+                return 0
+            full_size = self.baseline.get(query, {}).get(device)
+            return max(0, full_size - received) if full_size else 0
+
+    def save(self):
+        with self.lock:
+            write_json(self.path, self.baseline)
+
+
+class CompletionIndex:
+    """
+    Index of the names offered by an autocomplete (hosts, cards, commands), with a sorted list
+    for prefix matches and trigram postings for substring and fuzzy matches, so a keystroke
+    never scans the whole list. Names can carry attributes (site, group, platform...) which
+    queries can filter on with attr:value terms, e.g. 'site:ams mx'.
+    """
+
+    def __init__(self, max_candidates=2000):
+        self.lock = threading.Lock()
+        self.max_candidates = max_candidates
+        self.names = {}  # name -> {attribute: set of values}
+        self.sorted_names = []  # (lower case name, name), for the prefix matches
+        self.postings = {}  # trigram -> set of names
+        self.attr_postings = {}  # (attribute, value) -> set of names
+
+    def add(self, name, attributes):
+        self.names[name] = attributes
+        insort(self.sorted_names, (name.lower(), name))
+        for trigram in trigrams(name.lower()):
+            self.postings.setdefault(trigram, set()).add(name)
+        for attribute, values in attributes.items():
+            for value in values:
+                self.attr_postings.setdefault((attribute, value.lower()), set()).add(name)
+
+    def remove(self, name):
+        attributes = self.names.pop(name)
+        position = bisect_left(self.sorted_names, (name.lower(), name))
+        del self.sorted_names[position]
+        for trigram in trigrams(name.lower()):
+            self.postings[trigram].discard(name)
+        for attribute, values in attributes.items():
+            for value in values:
+                self.attr_postings[(attribute, value.lower())].discard(name)
+
+    def update(self, entries):
+        """
+        Brings the index in line with entries {name: {attribute: set of values}}, only the names
+        added, removed or with changed attributes are touched. Returns the number of changes.
+        """
+        with self.lock:
+            removed = [name for name in self.names if name not in entries]
+            modified = [name for name in self.names if name in entries and entries[name] != self.names[name]]
+            added = [name for name in entries if name not in self.names]
+            for name in removed + modified:
+                self.remove(name)
+            for name in modified + added:
+                self.add(name, entries[name])
+            return len(removed) + len(modified) + len(added)
+
+    def parse_query(self, query):
+        """Splits the query into the text to match and the {attribute: value} filters"""
+        text = []
+        filters = {}
+        for term in query.split():
+            attribute, _, value = term.partition(':')
+            if value:
+                filters[attribute.lower()] = value.lower()
+            else:
+                text.append(term)
+        return ' '.join(text).lower(), filters
+
+    def search(self, query, limit=20):
+        """
+        Returns up to limit (name, highlight ranges) ranked by prefix matches, then substring
+        matches, then the names sharing the most trigrams with the query.
+        """
+        text, filters = self.parse_query(query)
+        with self.lock:
+            allowed = None
+            for attribute, value in filters.items():
+                names = self.attr_postings.get((attribute, value), set())
+                allowed = set(names) if allowed is None else allowed & names
+            if allowed is not None and not text:
+                return [(name, []) for name in heapq.nsmallest(limit, allowed)]
+            results = []
+            seen = set()
+            # Prefix matches, straight off the sorted names
+            position = bisect_left(self.sorted_names, (text, ''))
+            while position < len(self.sorted_names) and len(results) < limit:
+                lower, name = self.sorted_names[position]
+                if not lower.startswith(text):
+                    break
+                if allowed is None or name in allowed:
+                    results.append((name, [(0, len(text))]))
+                    seen.add(name)
+                position += 1
+            query_trigrams = trigrams(text)
+            if len(results) >= limit:
+                return results
+            if not query_trigrams:
+                # Too short for trigrams, scanning a bounded number of the names for it instead
+                if allowed is not None:
+                    candidates = heapq.nsmallest(self.max_candidates, allowed)
+                else:
+                    candidates = (name for _, name in islice(self.sorted_names, self.max_candidates))
+                substring = []
+                for name in candidates:
+                    start = name.lower().find(text)
+                    if start != -1 and name not in seen:
+                        substring.append((start, name, [(start, start + len(text))]))
+                return results + [(name, ranges) for _, name, ranges in sorted(substring)[:limit - len(results)]]
+            # Counting the query trigrams each name has, rarest trigrams first and over a bounded
+            # number of candidates
+            hits = {}
+            for trigram in sorted(query_trigrams, key=lambda trigram: len(self.postings.get(trigram, ()))):
+                for name in self.postings.get(trigram, ()):
+                    if name not in seen and (allowed is None or name in allowed):
+                        hits[name] = hits.get(name, 0) + 1
+                if len(hits) > self.max_candidates:
+                    break
+            substring = []
+            fuzzy = []
+            for name, count in hits.items():
+                start = name.lower().find(text)
+                if start != -1:
+                    substring.append((start, name, [(start, start + len(text))]))
+                elif count * 2 >= len(query_trigrams):
+                    fuzzy.append((-count, name, []))
+            for _, name, ranges in sorted(substring) + sorted(fuzzy):
+                if len(results) >= limit:
+                    break
+                results.append((name, ranges))
+            return results
+
+
+class ConfigIndex:
+    """
+    In memory trigram index over the lower cased set lines of every device in the config cache.
+    Identical set lines across devices are stored once, and only devices which have been
+    committed since they were last indexed are re-indexed on refresh.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.line_ids = {}  # line text -> line id
+        self.line_text = []  # line id -> line text
+        self.line_devices = []  # line id -> set of devices having the line
+        self.postings = {}  # trigram -> set of line ids
+        self.device_lines = {}  # device -> list of line ids, in config order
+        self.device_commit = {}  # device -> commit time the device was indexed with
+        self.free_ids = []  # ids of the lines no device has anymore, reused for new lines
+
+    def add_line(self, line, device):
+        line_id = self.line_ids.get(line)
+        if line_id is None:
+            if self.free_ids:
+                line_id = self.free_ids.pop()
+                self.line_text[line_id] = line
+            else:
+                line_id = len(self.line_text)
+                self.line_text.append(line)
+                self.line_devices.append(set())
+            self.line_ids[line] = line_id
+        if not self.line_devices[line_id]:
+            for trigram in trigrams(line.lower()):
+                self.postings.setdefault(trigram, set()).add(line_id)
+        self.line_devices[line_id].add(device)
+        return line_id
+
+    def remove_device(self, device):
+        for line_id in self.device_lines.pop(device, []):
+            devices = self.line_devices[line_id]
+            devices.discard(device)
+            if not devices and self.line_text[line_id] is not None:
+                # Line gone from every config, freeing it so the index doesn't grow with every commit
+                line = self.line_text[line_id]
+                for trigram in trigrams(line.lower()):
+                    postings = self.postings[trigram]
+                    postings.discard(line_id)
+                    if not postings:
+                        del self.postings[trigram]
+                del self.line_ids[line]
+                self.line_text[line_id] = None
+                self.free_ids.append(line_id)
+        self.device_commit.pop(device, None)
+
+    def index_device(self, device, commit_time, config):
+        with self.lock:
+            self.remove_device(device)
+            self.device_lines[device] = [self.add_line(line, device) for line in config.splitlines() if line]
+            self.device_commit[device] = commit_time
+
+    def refresh(self, cfg_cache, devices=None):
+        """
+        Re-indexes the devices (all the cached devices by default) whose cached config has
+        changed, returns the devices re-indexed
+        """
+        changed = []
+        for device in cfg_cache.devices() if devices is None else devices:
+            commit_time = cfg_cache.commit_time(device)
+            if self.device_commit.get(device) == commit_time:
+                continue
+            config = cfg_cache.get(device)
+            if config is not None:
+                self.index_device(device, commit_time, config)
+                changed.append(device)
+        if devices is None:
+            with self.lock:
+                for device in set(self.device_lines) - set(cfg_cache.devices()):
+                    self.remove_device(device)
+        return changed
+
+    def candidates(self, literals):
+        """Returns the line ids containing all the trigrams of the literals, None if all lines are candidates"""
+        result = None
+        for literal in literals:
+            for trigram in trigrams(literal):
+                postings = self.postings.get(trigram, set())
+                result = set(postings) if result is None else result & postings
+                if not result:
+                    return set()
+        return result
+
+    def search(self, cfg_search, devices=None):
+        """
+        Returns {device: [matching lines]} for the regex cfg_search, same as '| match' on the device.
+        Falls back to a plain substring search if cfg_search isn't a valid regex.
+        Only the given devices are searched if devices is passed.
+        """
+        literals, matches = line_matcher(cfg_search)
+        with self.lock:
+            line_ids = self.candidates(literals)
+            if devices is not None:
+                device_line_ids = set()
+                for device in devices:
+                    device_line_ids.update(self.device_lines.get(device, []))
+                line_ids = device_line_ids if line_ids is None else line_ids & device_line_ids
+            elif line_ids is None:
+                line_ids = range(len(self.line_text))
+            matched = {line_id for line_id in line_ids
+                       if self.line_devices[line_id] and matches(self.line_text[line_id])}
+            matched_devices = set()
+            for line_id in matched:
+                matched_devices.update(self.line_devices[line_id])
+            if devices is not None:
+                matched_devices &= set(devices)
+            result = {}
+            for device in sorted(matched_devices):
+                result[device] = [self.line_text[line_id] for line_id in self.device_lines[device]
+                                  if line_id in matched]
+            return result
+
+
+class HardwareIndex:
+    """
+    On disk index of the chassis inventory of every device, mapping each model number to the
+    (device, slot path, serial number) of the modules at every nesting level
+    """
+
+    def __init__(self, cache_dir):
+        self.path = os.path.join(cache_dir, 'hardware.json')
+        self.lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        # {device: {'updated': epoch, 'modules': [[model, slot path, serial], ...]}}
+        self.devices = read_json(self.path)
+        self.models = {}
+        for device, entry in self.devices.items():
+            self.add_models(device, entry['modules'])
+
+    def add_models(self, device, modules):
+        for model, slot_path, serial in modules:
+            self.models.setdefault(model, []).append((device, slot_path, serial))
+
+    def update(self, device, modules):
+        with self.lock:
+            for model, _, _ in self.devices.get(device, {}).get('modules', []):
+                self.models[model] = [entry for entry in self.models.get(model, []) if entry[0] != device]
+            self.devices[device] = {'updated': time.time(), 'modules': modules}
+            self.add_models(device, modules)
+
+    def save(self):
+        with self.lock:
+            write_json(self.path, self.devices)
+
+    def lookup(self, model):
+        return sorted(self.models.get(model, []))
+
+    def stale(self, devices, max_age):
+        """Returns the set of devices which were never indexed or were indexed more than max_age seconds ago"""
+        now = time.time()
+        return {device for device in devices
+                if device not in self.devices or now - self.devices[device]['updated'] > max_age}
+
+
+class MetricHistory:
+    """
+    In memory ring buffer of the last size samples of each metric of each device, memory used
+    stays bounded however long the live mode runs
+    """
+
+    def __init__(self, size=360):
+        self.size = size
+        self.lock = threading.Lock()
+        self.series = {}  # device -> {metric: deque of values}
+
+    def add(self, device, sample):
+        """Appends the sample {metric: value} of the device, None values (metric not available) are skipped"""
+        with self.lock:
+            device_series = self.series.setdefault(device, {})
+            for metric, value in sample.items():
+                if value is not None:
+                    device_series.setdefault(metric, deque(maxlen=self.size)).append(value)
+
+    def get(self, device, metric):
+        with self.lock:
+            return list(self.series.get(device, {}).get(metric, []))
+
+
+def like_escape(text):
+    """Escapes the LIKE wildcards of text, for LIKE ... ESCAPE '\\'"""
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+class OutputArchive:
+    """
+    Archive of every command output collected, each distinct output is stored once, zlib
+    compressed and addressed by its sha256, with an index of which device returned it for
+    which command and when. Kept in sqlite rather than json, as the index grows by every
+    command of every run and has to be queried by device/command/time.
+    """
+
+    def __init__(self, cache_dir):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(os.path.join(cache_dir, 'archive.db'), check_same_thread=False)
+        self.db.executescript('''
+            CREATE TABLE IF NOT EXISTS blobs (digest TEXT PRIMARY KEY, size INTEGER, data BLOB);
+            CREATE TABLE IF NOT EXISTS outputs (device TEXT, command TEXT, collected REAL, source TEXT, digest TEXT);
+            CREATE INDEX IF NOT EXISTS outputs_device ON outputs (device, command, collected);
+        ''')
+
+    def put_many(self, device, outputs, source, collected=None):
+        """
+        Archives the {command: output} of the device, returns the number of outputs which differ
+        from the previous output archived for the device and command
+        """
+        collected = collected or time.time()
+        changed = 0
+        with self.lock:
+            for command, output in outputs.items():
+                data = output.encode()
+                digest = hashlib.sha256(data).hexdigest()
+                previous = self.db.execute(
+                    'SELECT digest FROM outputs WHERE device = ? AND command = ? ORDER BY collected DESC LIMIT 1',
+                    (device, command)).fetchone()
+                changed += previous is None or previous[0] != digest
+                self.db.execute('INSERT OR IGNORE INTO blobs VALUES (?, ?, ?)',
+                                (digest, len(data), zlib.compress(data)))
+                self.db.execute('INSERT INTO outputs VALUES (?, ?, ?, ?, ?)',
+                                (device, command, collected, source, digest))
+            self.db.commit()
+        return changed
+
+    def get(self, digest):
+        with self.lock:
+            row = self.db.execute('SELECT data FROM blobs WHERE digest = ?', (digest,)).fetchone()
+        return zlib.decompress(row[0]).decode() if row else None
+
+    def history(self, device='', command='', limit=500):
+        """
+        Returns the latest [(collected, device, command, source, digest, size)] of the devices
+        starting with device and the commands containing command
+        """
+        with self.lock:
+            return self.db.execute(
+                '''SELECT collected, device, outputs.command, source, outputs.digest, size FROM outputs
+                   JOIN blobs ON blobs.digest = outputs.digest
+                   WHERE device LIKE ? ESCAPE '\\' AND outputs.command LIKE ? ESCAPE '\\'
+                   ORDER BY collected DESC LIMIT ?''',
+                (like_escape(device) + '%', '%' + like_escape(command) + '%', limit)).fetchall()
+
+    def stats(self):
+        """Returns (outputs archived, distinct outputs, bytes before compression, bytes stored)"""
+        with self.lock:
+            outputs = self.db.execute('SELECT COUNT(*) FROM outputs').fetchone()[0]
+            blobs, raw, stored = self.db.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(LENGTH(data)), 0) FROM blobs').fetchone()
+        return outputs, blobs, raw, stored
+
+    def close(self):
+        with self.lock:
+            self.db.close()
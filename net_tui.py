@@ -1,55 +1,392 @@
-from nornir import InitNornir
-from nornir_pyez.plugins.tasks import pyez_rpc
-from nornir_pyez.plugins.tasks import pyez_facts
 from textual.app import App, ComposeResult
 from textual.containers import Container, Grid
 from textual.widgets import Header, Footer, Input, Static, Button, Label, TabbedContent, TabPane, LoadingIndicator, \
-    RadioSet, RadioButton
-from rich.syntax import Syntax
+    RadioSet, RadioButton, DataTable, Sparkline
 from rich.console import Console
-from nornir_napalm.plugins.tasks import napalm_cli
 from textual_autocomplete import AutoComplete, Dropdown, DropdownItem
 from textual.screen import ModalScreen
 import re
 import datetime
 import yaml
-import pyperclip
 from rich.table import Table
 from rich import box
 from nornir.core.task import Task, Result
 from textual import work
+from textual.worker import NoActiveWorker, WorkerState, get_current_worker
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from lxml import etree
+import time
+import os
+from output_viewer import OutputViewer
+from conn_pool import ConnectionPool, SaxNapalm
+from scheduler import AdaptiveRunner, not_cancelled, set_cancel_check
+import threading
+from rpc_models import get_model
+from tracing import Tracer
+from checks import write_snapshot, diff_snapshots
+from net_store import safe_name, ConfigCache, ConfigIndex, HardwareIndex, MetricHistory, TransferStats, CompletionIndex, \
+    OutputArchive, human_bytes
 
 today = datetime.date.today()
 console = Console()
 
-nr = InitNornir(config_file='norn_inv/config.yaml')
-nr_hosts = nr.inventory.hosts
-hosts_list = []
-for host in nr_hosts.keys():
-    hosts_list.append(DropdownItem(host))
+NORNIR_CONFIG = 'norn_inv/config.yaml'
+# Only the settings are read up front, nornir and the inventory are loaded once the UI is up
+with open(NORNIR_CONFIG, 'r') as f:
+    nornir_config = yaml.safe_load(f)
+settings = nornir_config.get('user_defined') or {}
+cache_dir = settings.get('cache_dir', '.net_tui_cache')
+cfg_index = ConfigIndex()
+transfer_stats = TransferStats(cache_dir)
+output_dir = os.path.join(cache_dir, 'output')
+hw_index_age = settings.get('hw_index', {}).get('refresh_minutes', 60) * 60
+live_settings = settings.get('live', {})
+metric_history = MetricHistory(live_settings.get('history_size', 360))
+# Times every host task and the connect/RPC/parse stages within, and the table builds, shown in the Latency tab
+tracer = Tracer(settings.get('trace', {}).get('max_spans', 100000))
+host_index = CompletionIndex()
+card_index = CompletionIndex()
+cli_index = CompletionIndex()
+
+# Set by load_inventory
+nr = None
+pool = None
+cfg_cache = None
+hw_index = None
+# Every command output collected is archived, to be browsed in the History tab
+archive = None
+inventory_ready = threading.Event()
+
+
+def worker_cancel_check():
+    """
+    Cancel check of the nornir runs, tied to the worker starting the run. Looked up on every run
+    rather than kept per thread, as the worker threads are reused.
+    """
+    try:
+        worker = get_current_worker()
+    except NoActiveWorker:
+        return not_cancelled
+    return lambda: worker.is_cancelled
 
-with open('card_inventory.txt', 'r') as f:
-    card_inv = f.readlines()
 
-with open('cli_commands.txt', 'r') as f:
-    cli_inv = f.readlines()
+def load_inventory():
+    """
+    Initialises nornir, the connection pool and the on disk stores. Takes a while on big
+    inventories and pulls in the network libraries, so it's run in the background on start up.
+    """
+    global nr, pool, cfg_cache, hw_index, archive
+    from nornir import InitNornir
+    from nornir.core.plugins.connections import ConnectionPluginRegister
+    from nornir.core.plugins.runners import RunnersPluginRegister
+
+    RunnersPluginRegister.register('adaptive', AdaptiveRunner)
+    set_cancel_check(worker_cancel_check)
+    nornir_obj = InitNornir(config_file=NORNIR_CONFIG)
+    # Registered once InitNornir has registered nornir_napalm's plugin, which it stands in for
+    ConnectionPluginRegister.deregister('napalm')
+    ConnectionPluginRegister.register('napalm', SaxNapalm)
+    pool_settings = settings.get('pool', {})
+    pool = ConnectionPool(nornir_obj, cache_dir,
+                          keepalive=pool_settings.get('keepalive_seconds', 60),
+                          idle_timeout=pool_settings.get('idle_timeout_seconds', 900),
+                          max_per_host=pool_settings.get('max_per_host', 2),
+                          warm_hosts=pool_settings.get('warm_hosts', 20),
+                          num_workers=nornir_obj.config.runner.options.get('num_workers', 10))
+    cfg_cache = ConfigCache(cache_dir,
+                            max_bytes=settings.get('cfg_cache', {}).get('max_mb', 200) * 1024 * 1024,
+                            max_devices=settings.get('cfg_cache', {}).get('max_devices', 5000))
+    hw_index = HardwareIndex(cache_dir)
+    archive = OutputArchive(cache_dir)
+    # Every run goes through the pool, so the connections are kept healthy between runs, and is traced
+    nr = nornir_obj.with_processors([pool, tracer])
+    inventory_ready.set()
+
+
+def host_attributes(host):
+    """Returns the inventory attributes the host autocomplete can filter on"""
+    attributes = {'group': {group.name for group in host.extended_groups()}}
+    if host.get('site'):
+        attributes['site'] = {str(host.get('site'))}
+    if host.platform:
+        attributes['platform'] = {host.platform}
+    return attributes
+
+
+def refresh_completions():
+    """Updates the autocomplete indexes from the inventory and the card/command lists, returns the changes"""
+    changes = host_index.update({name: host_attributes(host) for name, host in nr.inventory.hosts.items()})
+    with open('card_inventory.txt', 'r') as f:
+        changes += card_index.update({card.strip(): {} for card in f if card.strip()})
+    with open('cli_commands.txt', 'r') as f:
+        changes += cli_index.update({cli.strip(): {} for cli in f if cli.strip()})
+    return changes
+
+
+def completions(index, limit=20):
+    """Returns the Dropdown items function, matching the input against the completion index"""
+    def items(input_state):
+        dropdown_items = []
+        for name, highlight_ranges in index.search(input_state.value, limit):
+            site = ' '.join(sorted(index.names.get(name, {}).get('site', ())))
+            dropdown_items.append(DropdownItem(name, right_meta=site, highlight_ranges=highlight_ranges))
+        return dropdown_items
+    return items
+
+
+def napalm_driver(task):
+    """Returns the napalm connection of the host, timing the connect if it isn't open yet"""
+    if 'napalm' in task.host.connections:
+        return task.host.get_connection('napalm', task.nornir.config)
+    with tracer.span(task.host.name, 'connect', 'napalm'):
+        return task.host.get_connection('napalm', task.nornir.config)
+
+
+def pyez_device(task):
+    """
+    Returns the pyez Device of the host. It's the one the napalm junos driver is built on, so
+    the RPCs and the CLI commands share a single NETCONF session per host.
+    """
+    return napalm_driver(task).device
 
-cards = []
-cli_cmds = []
 
-for card in card_inv:
-    cards.append(DropdownItem(card.strip()))
+def cli_task(task: Task, commands):
+    """Nornir task which returns the {command: output} of the commands run through napalm, timing each stage"""
+    from nornir_napalm.plugins.tasks import napalm_cli
 
-for cli in cli_inv:
-    cli_cmds.append(DropdownItem(cli.strip()))
+    napalm_driver(task)
+    # Traced as one span per set of commands, as they're run over the session together
+    name = f'{commands[0]} +{len(commands) - 1}' if len(commands) > 1 else ''.join(commands)
+    with tracer.span(task.host.name, 'cli', name):
+        outputs = task.run(task=napalm_cli, commands=commands).result
+    return Result(host=task.host, result=outputs)
+
+
+def config_task(task: Task):
+    """
+    Nornir task which returns the set format config of the host. Config is fetched from the
+    device only if it has been committed since the copy in the config cache.
+    """
+    device = pyez_device(task)
+    commit = get_model(device, 'get-commit-information', tracer.host_span(task.host.name))[0]
+    commit_time = commit.seconds or commit.date_time
+    config = cfg_cache.get(task.host.name, commit_time)
+    if config is None:
+        cfg_result = task.run(name='config', task=cli_task, commands=['show configuration | display set'])
+        config = cfg_result.result['show configuration | display set']
+        cfg_cache.put(task.host.name, commit_time, config)
+        archive.put_many(task.host.name, {'show configuration | display set': config}, 'config')
+    return Result(host=task.host, result=config)
+
+
+def protocols_task(task: Task):
+    """
+    Nornir task which returns the protocols configured on the host. Only the protocols stanza
+    is requested from the device, instead of the full config.
+    """
+    device = pyez_device(task)
+    with tracer.span(task.host.name, 'rpc', 'get-config protocols'):
+        cfg = device.rpc.get_config(filter_xml='<protocols/>')
+    received = len(etree.tostring(cfg))
+    protocols = [protocol.tag for protocol in cfg.findall('protocols/*')]
+    return Result(host=task.host, result={'protocols': protocols, 'received': received})
 
 
 def protocol_list(nornir_obj, device_name):
-    cfg_result = nornir_obj.run(task=napalm_cli, commands=['show configuration | display set'])
-    cfg_output = cfg_result[device_name][0].result['show configuration | display set']
-    protocols = re.findall(".*protocols (\w+).*", cfg_output)
-    unique_protocols = list(set(protocols))
-    return unique_protocols
+    """Returns the protocols configured on the device along with the bytes received"""
+    protocols_result = nornir_obj.run(task=protocols_task, on_failed=True)
+    if protocols_result[device_name].failed:
+        # Falling back to the cached config if the device can't be reached
+        cfg_output = cfg_cache.get(device_name) or ''
+        protocols = re.findall(".*protocols (\w+).*", cfg_output)
+        return list(set(protocols)), 0
+    result = protocols_result[device_name][0].result
+    return result['protocols'], result['received']
+
+
+def load_check_cmds():
+    with open("cmds.yml", "r") as f:
+        return yaml.safe_load(f)
+
+
+def check_commands(all_cmds, protocols, level):
+    """Returns the check commands of the protocols, along with the protocols having no checks"""
+    commands = []
+    protocols_na = []
+    for protocol in protocols:
+        try:
+            commands.extend(all_cmds[protocol][level])
+        except KeyError:
+            protocols_na.append(protocol)
+    return commands, protocols_na
+
+
+def checks_task(task: Task, all_cmds, level, snapshot_dir):
+    """
+    Nornir task which runs the checks generated for the host and saves their output as a
+    snapshot in snapshot_dir, returns the snapshot path
+    """
+    protocols = task.run(task=protocols_task).result['protocols']
+    commands, _ = check_commands(all_cmds, protocols, level)
+    outputs = task.run(task=cli_task, commands=commands).result if commands else {}
+    path = os.path.join(snapshot_dir, f'{safe_name(task.host.name)}.txt')
+    write_snapshot(path, outputs)
+    archive.put_many(task.host.name, outputs, f'{os.path.basename(snapshot_dir)} checks')
+    return Result(host=task.host, result=path)
+
+
+def target_nornir(targets):
+    """Returns nornir filtered to the targets, either comma separated device names or group:<name>"""
+    targets = targets.strip()
+    if targets.startswith('group:'):
+        group = targets[len('group:'):].strip()
+        return nr.filter(filter_func=lambda host: host.has_parent_group(group))
+    names = {name.strip() for name in targets.split(',') if name.strip()}
+    return nr.filter(filter_func=lambda host: host.name in names)
+
+
+# Pipes giving the same output when napalm applies them again, count and trim would be applied twice
+PIPE_COMMANDS = ('match', 'except', 'last', 'no-more')
+
+
+def remote_pipe(remote_filter):
+    """
+    Returns the CLI pipe applying the filter on the device, e.g. 'except Down' or 'last 20'.
+    Anything not starting with a pipe command is matched as a regex. napalm only passes on the
+    first word after each pipe command and applies the pipe again on the output as a regex,
+    quotes included, so arguments are single words without quotes, or ValueError is raised.
+    """
+    remote_filter = remote_filter.strip().lstrip('|').strip()
+    if not remote_filter:
+        return ''
+    if remote_filter.split()[0] not in PIPE_COMMANDS:
+        remote_filter = f'match {remote_filter}'
+    pipes = []
+    for pipe in remote_filter.split('|'):
+        words = pipe.replace('"', ' ').replace("'", ' ').split()
+        if not words or words[0] not in PIPE_COMMANDS or len(words) > 2 or \
+                (words[0] in ('match', 'except') and len(words) != 2):
+            raise ValueError(f"Remote filter '{pipe.strip()}' not supported, it has to be a pipe command and a "
+                             f"single word argument, e.g. 'except Down' or 'match Estab.*ished'")
+        pipes.append(' '.join(words))
+    return ''.join(f' | {pipe}' for pipe in pipes)
+
+
+def cfg_search_text(search_result, note=''):
+    """Returns the config search result grouped per router, note tells where the config came from"""
+    cfg_search_result = ''
+    for router, matched_lines in search_result.items():
+        value = '\n'.join(matched_lines)
+        cfg_search_result = cfg_search_result + f'~~ Config found in {router}{note} ~~\n{value}\n\n'
+    return cfg_search_result
+
+
+def chassis_task(task: Task):
+    """Nornir task which returns the modules of the chassis inventory of the host"""
+    device = pyez_device(task)
+    return Result(host=task.host, result=get_model(device, 'get-chassis-inventory', tracer.host_span(task.host.name)))
+
+
+# host name -> Future of the chassis inventory fetch under way, so the refreshes going on at the same
+# time (background refresh, card lookups) fetch each device once
+hw_fetches = {}
+hw_fetches_lock = threading.Lock()
+
+
+def refresh_hw_index(max_age, on_host=None):
+    """
+    Fetches the chassis inventory of the devices indexed more than max_age seconds ago.
+    on_host(router, result) is called as soon as each device is indexed. Devices already being
+    fetched by another refresh are waited for, rather than fetched again.
+    """
+    with hw_fetches_lock:
+        stale_hosts = hw_index.stale(nr.inventory.hosts, max_age)
+        shared = {host: hw_fetches[host] for host in stale_hosts if host in hw_fetches}
+        fetches = {host: Future() for host in stale_hosts if host not in hw_fetches}
+        hw_fetches.update(fetches)
+
+    def host_done(router, result):
+        if not result.failed:
+            hw_index.update(router, [[module.model, module.slot_path, module.serial] for module in result[0].result])
+        with hw_fetches_lock:
+            hw_fetches.pop(router, None)
+        fetches[router].set_result(result)
+        if on_host:
+            on_host(router, result)
+
+    def shared_done(router, future):
+        if on_host and not future.cancelled():
+            on_host(router, future.result())
+
+    for router, future in shared.items():
+        future.add_done_callback(lambda future, router=router: shared_done(router, future))
+    try:
+        if fetches:
+            stream_run(nr.filter(filter_func=lambda host: host.name in fetches), host_done, task=chassis_task)
+            hw_index.save()
+    finally:
+        # Not left for the other refreshes to wait on, if the run failed
+        with hw_fetches_lock:
+            for router, future in fetches.items():
+                if hw_fetches.get(router) is future:
+                    del hw_fetches[router]
+                future.cancel()
+    wait(shared.values())
+
+
+def stream_run(nornir_obj, on_host, **kwargs):
+    """
+    Runs the task calling on_host(host name, result) as soon as each host is done. Hosts given
+    up on by the scheduler (timed out, circuit open) are handed over once the run is over.
+    """
+    processor = StreamProcessor(on_host)
+    # Failing hosts are taken care of by the scheduler's circuit breaker, nornir would otherwise
+    # skip a host in every later run once it has failed a single run
+    run_result = nornir_obj.with_processors(list(nornir_obj.processors) + [processor]).run(on_failed=True, **kwargs)
+    processor.close(run_result)
+    return run_result
+
+
+class StreamProcessor:
+    """Nornir processor which hands over the result of each host as soon as the host is done"""
+
+    def __init__(self, on_host):
+        self.on_host = on_host
+        self.reported = set()
+        self.closed = False
+        self.lock = threading.Lock()
+
+    def report(self, host_name, result):
+        with self.lock:
+            if self.closed or host_name in self.reported:
+                return
+            self.reported.add(host_name)
+        self.on_host(host_name, result)
+
+    def close(self, run_result):
+        """Reports the hosts of the run not reported yet, hosts finishing after this are ignored"""
+        for host_name, result in run_result.items():
+            self.report(host_name, result)
+        with self.lock:
+            self.closed = True
+
+    def task_started(self, task):
+        pass
+
+    def task_completed(self, task, result):
+        pass
+
+    def task_instance_started(self, task, host):
+        pass
+
+    def task_instance_completed(self, task, host, result):
+        self.report(host.name, result)
+
+    def subtask_instance_started(self, task, host):
+        pass
+
+    def subtask_instance_completed(self, task, host, result):
+        pass
 
 
 class QuitScreen(ModalScreen):
@@ -70,18 +407,331 @@ class QuitScreen(ModalScreen):
             self.app.pop_screen()
 
 
-def main_task(task: Task):
+# Dashboard RPCs which don't depend on each other, these are all fired together on the same session
+DASH_RPCS = {
+    'alarms': 'get-system-alarm-information',
+    'rib_fib': 'get-route-summary-information',
+    'memory': 'get-system-memory-information',
+    'cpu': 'get-route-engine-information',
+    'commit': 'get-commit-information',
+}
+
+# Protocol RPCs are fired as soon as we know which protocols are configured on the device
+PROTOCOL_RPCS = {
+    'bgp': 'get-bgp-summary-information',
+    'isis': 'get-isis-adjacency-information',
+    'ospf': 'get-ospf-neighbor-information',
+    'mpls': 'get-mpls-lsp-information',
+    'ldp': 'get-ldp-session-information',
+}
+
+
+def timed_call(func, *args, **kwargs):
+    """Runs func and returns a tuple of (result, seconds taken)"""
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def get_facts(device, span):
+    with span('rpc', 'facts'):
+        return {key: device.facts.get(key) for key in ('version', 'model', 'serialnumber', 'RE0', 'RE1')}
+
+
+def get_protocols(device, span):
+    """Returns the protocols configured on the device, fetching only the protocols stanza"""
+    with span('rpc', 'get-config protocols'):
+        cfg = device.rpc.get_config(filter_xml='<protocols/>')
+    return [protocol.tag for protocol in cfg.findall('protocols/*')]
+
+
+def main_task(task: Task, on_panel=None, protocols=None):
+    """
+    Nornir task which fires all the dashboard RPCs concurrently over the single pyez
+    (NETCONF) session of the host. on_panel(name, data, seconds) is called as soon as
+    each RPC comes back, data is the exception raised if the RPC failed.
+    Passing the protocols already known to be configured skips the facts and protocols
+    lookup, which is what the live polls do.
+    Returns the aggregated data along with the latency of each RPC
+    """
+    device = pyez_device(task)
+    span = tracer.host_span(task.host.name)
+    panel_data = {}
+    latency = {}
+    with ThreadPoolExecutor(max_workers=len(DASH_RPCS) + len(PROTOCOL_RPCS) + 2) as executor:
+        if protocols is None:
+            pending = {executor.submit(timed_call, get_facts, device, span): 'facts',
+                       executor.submit(timed_call, get_protocols, device, span): 'protocols'}
+        else:
+            pending = {executor.submit(timed_call, get_model, device, PROTOCOL_RPCS[protocol], span): protocol
+                       for protocol in protocols if protocol in PROTOCOL_RPCS}
+        for name, func in DASH_RPCS.items():
+            pending[executor.submit(timed_call, get_model, device, func, span)] = name
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = pending.pop(future)
+                try:
+                    data, seconds = future.result()
+                except Exception as exc:
+                    data, seconds = exc, None
+                panel_data[name] = data
+                latency[name] = seconds
+                if name == 'protocols' and not isinstance(data, Exception):
+                    for protocol in data:
+                        if protocol in PROTOCOL_RPCS:
+                            future = executor.submit(timed_call, get_model, device, PROTOCOL_RPCS[protocol], span)
+                            pending[future] = protocol
+                if on_panel:
+                    on_panel(name, data, seconds)
+    return Result(host=task.host, result={'data': panel_data, 'latency': latency})
+
+
+def sys_info_table(facts_data, alarms_data):
+    version = facts_data.get('version')
+    model = facts_data.get('model')
+    serial_num = facts_data.get('serialnumber')
+    re0 = facts_data.get('RE0')
+    re1 = facts_data.get('RE1')  # Returns None if RE1 is not present
+    if re0:
+        re0_uptime = re0.get('up_time')
+        re0_last_reboot_reason = re0.get('last_reboot_reason')
+    else:
+        re0_uptime = 'NA'
+        re0_last_reboot_reason = 'NA'
+    if re1:
+        re1_uptime = re1.get('up_time')
+        re1_last_reboot_reason = re1.get('last_reboot_reason')
+    else:
+        re1_uptime = 'NA'
+        re1_last_reboot_reason = 'NA'
+    alarms_list_final = active_alarms(alarms_data) or ["None"]
+
+    table = Table(show_lines=True, show_header=False, box=box.ASCII, title='System Information')
+    table.add_column("Field", justify="right", style="magenta", width=18)
+    table.add_column("Details", style="cyan", width=50)
+    table.add_row('SW version', version)
+    table.add_row('Model', model)
+    table.add_row('Serial Number', serial_num)
+    table.add_row('RE0 uptime', re0_uptime)
+    table.add_row('RE0 last reboot reason', re0_last_reboot_reason)
+    table.add_row('RE1 uptime', re1_uptime)
+    table.add_row('RE1 last reload reason', re1_last_reboot_reason)
+
+    for alarm in alarms_list_final:
+        table.add_row('Active alarms', alarm)
+    return table
+
+
+def active_alarms(alarms):
+    """Returns the description of the active alarms"""
+    return [alarm.description for alarm in alarms]
+
+
+def memory_used(memory):
+    return 100 - memory.free_percent
+
+
+def cpu_usage(route_engines):
+    # First RE is reported on devices having dual REs
+    return route_engines[0].cpu_user
+
+
+def active_routes(route_tables, table_name='inet.0'):
+    """Returns the active route count of the routing table"""
+    for route_table in route_tables:
+        if route_table.name == table_name:
+            return route_table.active_routes
+    return 0
+
+
+def mem_cpu_table(memory_data, cpu_data):
+    table = Table(show_header=False, box=box.ASCII, width=50, title='Memory & CPU Information')
+    table.add_column("Field", justify="left", style="magenta")
+    table.add_column("Values", justify="left", style="cyan")
+    table.add_row("[cyan]CPU in use[/cyan]", f"[green]{cpu_usage(cpu_data)}%")
+    table.add_row("[cyan]\nMemory in use[/cyan]", f"\n[green]{memory_used(memory_data)}%")
+    return table
+
+
+def last_commit(commits):
+    """Returns (user, time) of the last commit"""
+    return commits[0].user, commits[0].date_time
+
+
+def commit_table(commit_data):
+    commit_user, commit_time = last_commit(commit_data)
+
+    table = Table(show_header=False, box=box.ASCII, width=50, title='Commit Information', style="blue")
+    table.add_column("Field", justify="left")
+    table.add_row("[cyan]Last commit by [/cyan]", f"[green]{commit_user}")
+    table.add_row("[cyan]\nLast commit at [/cyan]", f"\n[green]{commit_time}")
+    return table
+
+
+def count_states(adjacencies, up_state):
+    """Returns (up, down) count of the adjacencies"""
+    up_count = sum(1 for adjacency in adjacencies if adjacency.state == up_state)
+    return up_count, len(adjacencies) - up_count
+
+
+def lsp_counts(lsps):
+    """Returns {session type: (up, down)} count of the RSVP LSPs"""
+    return {lsp.session_type: (lsp.up, lsp.down) for lsp in lsps}
+
+
+def protocol_counts(protocol, data):
+    """Returns (up, down) count of the BGP peers/ISIS adjacencies/OSPF neighbors/LDP sessions/LSPs"""
+    if protocol == 'bgp':
+        return data.peer_count - data.down_peer_count, data.down_peer_count
+    if protocol == 'isis':
+        return count_states(data, 'Up')
+    if protocol == 'ospf':
+        return count_states(data, 'Full')
+    if protocol == 'ldp':
+        return count_states(data, 'Operational')
+    if protocol == 'mpls':
+        return sum(lsp.up for lsp in data), sum(lsp.down for lsp in data)
+    return None
+
+
+def protocol_rows(protocol, data):
+    """Returns the rows to be added in the Protocol Information table for the given protocol"""
+    if protocol == 'bgp':
+        up_count, down_count = protocol_counts(protocol, data)
+        return [("BGP Peer UP count", str(up_count)),
+                ("[yellow]BGP Peer DOWN count", str(down_count))]
+    if protocol == 'isis':
+        up_count, down_count = protocol_counts(protocol, data)
+        return [("ISIS Adj UP count", str(up_count)),
+                ("[yellow]ISIS Adj DOWN count", str(down_count))]
+    if protocol == 'ospf':
+        up_count, down_count = protocol_counts(protocol, data)
+        return [("OSPF Nbr UP/Full count", str(up_count)),
+                ("[yellow]OSPF Nbr DOWN count", str(down_count))]
+    if protocol == 'mpls':
+        lsp_dict = lsp_counts(data)
+        return [("MPLS Ingress LSP UP count", str(lsp_dict['Ingress'][0])),
+                ("[yellow]MPLS Ingress LSP DOWN count", str(lsp_dict['Ingress'][1])),
+                ("MPLS Egress LSP UP count", str(lsp_dict['Egress'][0])),
+                ("[yellow]MPLS Egress LSP DOWN count", str(lsp_dict['Egress'][1])),
+                ("MPLS Transit LSP UP count", str(lsp_dict['Transit'][0])),
+                ("[yellow]MPLS Transit LSP DOWN count", str(lsp_dict['Transit'][1]))]
+    if protocol == 'ldp':
+        up_count, down_count = protocol_counts(protocol, data)
+        return [("LDP Session Operational count", str(up_count)),
+                ("[yellow]LDP Session Non-Operational count", str(down_count))]
+    return []
+
+
+def health_summary(panel_data):
     """
-    Nornir task which groups together all the individual tasks and
-    returns Aggregated result
+    Returns the health numbers of a device from the panel data of main_task, values which
+    couldn't be fetched or parsed are None
     """
-    task.run(name='facts', task=pyez_facts)
-    task.run(name='alarms', task=pyez_rpc, func='get-system-alarm-information')
-    task.run(name='rib_fib', task=pyez_rpc, func='get-route-summary-information')
-    task.run(name='memory', task=pyez_rpc, func='get-system-memory-information')
-    task.run(name='cpu', task=pyez_rpc, func='get-route-engine-information')
-    task.run(name='commit', task=pyez_rpc, func='get-commit-information')
-    return Result(host=task.host)
+    def value(func, *rpcs):
+        try:
+            return func(*[panel_data[rpc] for rpc in rpcs])
+        except (KeyError, TypeError, IndexError, ValueError, AttributeError):
+            return None
+
+    summary = {
+        'model': value(lambda facts: facts.get('model'), 'facts'),
+        'version': value(lambda facts: facts.get('version'), 'facts'),
+        'alarms': value(lambda alarms: len(active_alarms(alarms)), 'alarms'),
+        'cpu': value(cpu_usage, 'cpu'),
+        'memory': value(memory_used, 'memory'),
+        'commit': value(lambda commit: last_commit(commit)[1], 'commit'),
+        'routes': value(active_routes, 'rib_fib'),
+    }
+    for protocol in PROTOCOL_RPCS:
+        counts = value(lambda data, protocol=protocol: protocol_counts(protocol, data), protocol)
+        summary[f'{protocol}_up'], summary[f'{protocol}_down'] = counts if counts else (None, None)
+    return summary
+
+
+def protocols_table(rows):
+    table = Table(show_lines=True, show_header=False, box=box.ASCII, width=47, title='Protocol Information')
+    table.add_column("Field", justify="right", style="magenta")
+    table.add_column("Details", style="cyan")
+    for field, value in rows:
+        table.add_row(field, value)
+    return table
+
+
+def rpc_stats_table(stats):
+    table = Table(box=box.ASCII, title='Latency per RPC (p95 slowest first)')
+    for header in ('Stage', 'RPC', 'Count', 'p50 s', 'p95 s', 'Max s'):
+        table.add_column(header, justify='left' if header in ('Stage', 'RPC') else 'right', style="cyan")
+    for stage, name, count, p50, p95, slowest in stats:
+        table.add_row(stage, name, str(count), f'{p50:.3f}', f'{p95:.3f}', f'{slowest:.3f}')
+    return table
+
+
+def slow_hosts_table(hosts):
+    table = Table(box=box.ASCII, title='Slowest hosts')
+    for header in ('Host', 'Task s', 'Slowest stage'):
+        table.add_column(header, justify='right' if header == 'Task s' else 'left', style="magenta")
+    for host, seconds, slowest in hosts:
+        table.add_row(host, f'{seconds:.2f}', f'{slowest[0]} {slowest[1]} ({slowest[2]:.2f}s)' if slowest else '-')
+    return table
+
+
+def latency_table(latency):
+    table = Table(box=box.ASCII, width=47, title='Panel Latency')
+    table.add_column("RPC", justify="left", style="magenta")
+    table.add_column("Seconds", justify="right", style="cyan")
+    for name, seconds in sorted(latency.items(), key=lambda item: -(item[1] or 0)):
+        table.add_row(name, 'failed' if seconds is None else f'{seconds:.2f}')
+    return table
+
+
+# Fleet overview columns, (key in the fleet row, header)
+FLEET_COLUMNS = (('device', 'Device'), ('status', 'Status'), ('model', 'Model'), ('version', 'Version'),
+                 ('alarms', 'Alarms'), ('cpu', 'CPU %'), ('memory', 'Mem %'), ('routes', 'inet.0 routes'),
+                 ('commit', 'Last commit'), ('bgp', 'BGP up/down'), ('isis', 'ISIS up/down'),
+                 ('ospf', 'OSPF up/down'), ('ldp', 'LDP up/down'), ('mpls', 'LSP up/down'))
+
+
+def fleet_row(device, multi_result):
+    """Returns the fleet overview row of the device from its main_task result"""
+    if multi_result.failed:
+        exception = multi_result[0].exception
+        return {'device': device, 'status': f'failed ({type(exception).__name__})' if exception else 'failed'}
+    summary = health_summary(multi_result[0].result['data'])
+    row = {key: summary.get(key) for key, _ in FLEET_COLUMNS}
+    row['device'] = device
+    failed_rpcs = [name for name, data in multi_result[0].result['data'].items() if isinstance(data, Exception)]
+    row['status'] = f'partial ({", ".join(failed_rpcs)} failed)' if failed_rpcs else 'ok'
+    for protocol in PROTOCOL_RPCS:
+        if summary[f'{protocol}_up'] is not None:
+            # Sorting on a protocol column brings the most down sessions to the top when reversed
+            row[protocol] = (summary[f'{protocol}_down'], summary[f'{protocol}_up'])
+    return row
+
+
+def fleet_cells(row):
+    """Returns the rendered cells of a fleet row"""
+    cells = []
+    for key, _ in FLEET_COLUMNS:
+        value = row.get(key)
+        if value is None:
+            cells.append('-')
+        elif key in PROTOCOL_RPCS:
+            down, up = value
+            cells.append(f'{up}/[red]{down}[/red]' if down else f'{up}/{down}')
+        elif key == 'status' and value != 'ok' or key == 'alarms' and value:
+            cells.append(f'[red]{value}')
+        else:
+            cells.append(str(value))
+    return cells
+
+
+# Metrics kept in the live mode history, and the ones trended on the dashboard with their labels
+LIVE_METRICS = ('cpu', 'memory', 'bgp_up', 'bgp_down', 'isis_up', 'isis_down', 'ospf_up', 'ospf_down',
+                'ldp_up', 'ldp_down', 'mpls_up', 'mpls_down')
+LIVE_TRENDS = (('cpu', 'CPU %'), ('memory', 'Mem %'), ('bgp_down', 'BGP down'), ('isis_down', 'ISIS down'),
+               ('ospf_down', 'OSPF down'), ('ldp_down', 'LDP down'), ('mpls_down', 'LSP down'))
 
 
 class NetTUI(App):
@@ -92,6 +742,8 @@ class NetTUI(App):
     BINDINGS = [("d", "toggle_dark", "Toggle dark mode"),
                 ("c", "copy_cmds", "Copy to clipboard"),
                 ("f", "fetch_output", "Fetch output"),
+                ("r", "refresh_hw", "Refresh HW index"),
+                ("i", "reload_inventory", "Reload inventory"),
                 ("q", "request_quit", "Quit")]
 
     def compose(self) -> ComposeResult:
@@ -104,12 +756,26 @@ class NetTUI(App):
                 yield Container(
                     AutoComplete(Input(
                         placeholder="Device Name", id="device_name"),
-                        Dropdown(items=hosts_list, id='host_dropdown')),
+                        Dropdown(items=completions(host_index), id='host_dropdown')),
                     Button(label="Build Dashboard", variant="primary", id="button1"),
+                    Button(label="Go Live", variant="success", id="live_button"),
                     id="input_container")
 
                 yield LoadingIndicator(id='load1')
-                yield Container(Static(id="static1_1"), id='container1')
+                yield Static(id='dash_title')
+                yield Container(Static(id='sys_panel'), Static(id='proto_panel'),
+                                Container(Static(id='mem_cpu_panel'), Static(id='commit_panel'), id='right_panels'),
+                                id='container1')
+                yield Static(id='dash_latency')
+                yield Container(*[Container(Static(id=f'{metric}_label', classes='trend_label'),
+                                            Sparkline([], summary_function=max, id=f'{metric}_trend'),
+                                            classes='trend')
+                                  for metric, _ in LIVE_TRENDS], id='live_trends')
+                yield Container(Input(placeholder="Group (blank for whole inventory)", id="fleet_group"),
+                                Button(label="Fleet Overview", variant="primary", id="fleet_button"),
+                                Static(id='fleet_progress'),
+                                id='fleet_container')
+                yield DataTable(id='fleet_table')
 
             with TabPane("Checker", id='check'):
                 yield LoadingIndicator(id='load2')
@@ -117,7 +783,7 @@ class NetTUI(App):
                     AutoComplete(Input(
                         placeholder="Enter the card name to lookup",
                         id="card_name"),
-                        Dropdown(items=cards, id='card_dropdown')),
+                        Dropdown(items=completions(card_index), id='card_dropdown')),
 
                     Button(label="Clear!", variant="primary", id="clear_button"),
                     id="card_container")
@@ -133,36 +799,111 @@ class NetTUI(App):
                 yield Container(AutoComplete(Input(
                     placeholder="Fetch output of commands from all devices :",
                     id="cmds"),
-                    Dropdown(items=cli_cmds, id='cli_dropdown')),
+                    Dropdown(items=completions(cli_index), id='cli_dropdown')),
+                    Input(placeholder="Remote filter (match/except/last..)", id="remote_filter"),
 
                     Button(label="Fetch!", variant="primary", id="fetch_button"),
                     id="cmd_container",
                 )
 
-                yield Static(id='out')
+                yield Container(Static(id='progress'),
+                                Input(placeholder="Search output (@host to jump to a host)", id="out_search"),
+                                id='progress_container')
+                yield OutputViewer(os.path.join(output_dir, 'checker_output.txt'), id='out')
 
             with TabPane("Generator", id='gen'):
                 yield Container(AutoComplete(Input(placeholder="Enter the device name to generate checks",
-                                                   id="device_name2"), Dropdown(items=hosts_list, id='host_dropdown2')),
+                                                   id="device_name2"), Dropdown(items=completions(host_index), id='host_dropdown2')),
 
                                 id="input_container2")
                 yield Container(RadioSet(RadioButton("terse", value=True),
                                          RadioButton("verbose"), id='default'),
                                 Button(label="generate", variant="primary", id="generate"), id='button_container2')
 
+                yield Container(Input(placeholder="Devices for pre/post checks: comma separated or group:<name>",
+                                      id="check_devices"),
+                                Input(placeholder="Change name (default today)", id="check_window"),
+                                Button(label="Pre checks", variant="primary", id="pre_button"),
+                                Button(label="Post checks", variant="warning", id="post_button"),
+                                id='checks_container')
+
                 yield LoadingIndicator(id='load3')
-                yield Static(id='gen_out')
+                yield OutputViewer(os.path.join(output_dir, 'generator_output.txt'), id='gen_out')
+
+            with TabPane("History", id='history'):
+                yield Container(AutoComplete(Input(placeholder="Device name (blank for all)", id="hist_device"),
+                                             Dropdown(items=completions(host_index), id='host_dropdown3')),
+                                Input(placeholder="Command containing", id="hist_cmd"),
+                                Button(label="Browse", variant="primary", id="hist_button"),
+                                Static(id='hist_stats'),
+                                id='hist_container')
+                yield DataTable(id='hist_table')
+                yield OutputViewer(os.path.join(output_dir, 'history_output.txt'), id='hist_out')
+
+            with TabPane("Latency", id='latency'):
+                yield Container(Button(label="Refresh", variant="primary", id="trace_refresh"),
+                                Button(label="Export trace", variant="success", id="trace_export"),
+                                Static(id='trace_note'),
+                                id='trace_container')
+                yield Container(Static(id='trace_hosts'), Static(id='trace_rpcs'), id='trace_panels')
 
         yield Footer()
 
     def on_mount(self) -> None:
         """Called when app starts."""
+        # group -> (query, worker) of the last query started in the group
+        self.flights = {}
+        self.fleet_rows = {}
+        self.fleet_pending = []
+        self.fleet_lock = threading.Lock()
+        self.fleet_sort = ('device', False)
+        self.dash_device = None
+        self.live_device = None
+        self.live_worker = None
+        self.live_protocols = {}  # device -> protocols configured, so the polls skip the lookup
+        self.live_next = {}  # device -> monotonic time of the next poll
+        self.live_failures = {}  # device -> polls failed in a row
+        self.set_interval(1, self.live_tick)
+        self.query_one("#fleet_table", DataTable).add_columns(*[header for _, header in FLEET_COLUMNS])
+        self.hist_rows = []
+        hist_table = self.query_one("#hist_table", DataTable)
+        hist_table.cursor_type = 'row'
+        hist_table.add_columns('Collected', 'Device', 'Command', 'Source', 'Size')
+        # Fleet rows are added in batches, so thousands of hosts reporting back don't flood the UI thread
+        self.set_interval(0.5, self.flush_fleet_rows)
         # Give the input focus, so we can start typing straight away
         self.query_one("#device_name").focus()
         # Disabling the loading indicators to start with
         self.query_one('#load1').display = False
         self.query_one('#load2').display = False
         self.query_one('#load3').display = False
+        self.sub_title = 'loading inventory'
+        # Loading after the first paint, so the screen doesn't wait on the loader for the GIL
+        self.call_after_refresh(self.inventory_load)
+
+    @work(exclusive=True, group='inventory')
+    def inventory_load(self, reload=False):
+        old_pool = pool
+        load_inventory()
+        if old_pool:
+            old_pool.stop()
+        changes = refresh_completions()
+        self.call_from_thread(self.inventory_loaded, changes, reload)
+
+    def inventory_loaded(self, changes, reload):
+        """Starts the background jobs once the inventory is loaded"""
+        self.sub_title = f'{len(nr.inventory.hosts)} devices'
+        self.cfg_index_build()
+        pool.start()
+        # Keeping the hardware index fresh in the background, so card lookups never wait for the fleet
+        self.hw_index_refresh()
+        if reload:
+            self.notify(f'Inventory reloaded, {changes} autocomplete entries updated')
+        else:
+            self.set_interval(hw_index_age, self.hw_index_refresh)
+
+    def action_reload_inventory(self):
+        self.inventory_load(reload=True)
 
     def action_request_quit(self) -> None:
         self.push_screen(QuitScreen())
@@ -172,337 +913,605 @@ class NetTUI(App):
         """Run when user clicks a button"""
         if event.button.id == 'button1':
             device_name = self.query_one("#device_name")
-            self.dasbboard_build(device_name.value)
+            self.single_flight('dash', self.dasbboard_build, device_name.value)
+        elif event.button.id == 'live_button':
+            self.toggle_live(self.query_one("#device_name").value)
+        elif event.button.id == 'fleet_button':
+            self.single_flight('fleet', self.fleet_build, self.query_one("#fleet_group").value.strip())
         elif event.button.id == 'clear_button':
             self.query_one("#card_name").action_delete_left_all()
             self.query_one("#cfg").action_delete_left_all()
             self.query_one("#cmds").action_delete_left_all()
-            self.query_one("#out", Static).update('')
+            self.query_one("#out", OutputViewer).reset()
         elif event.button.id == 'search_button':
             cfg_src = self.query_one("#cfg")
             if cfg_src.value:
-                self.cfg_fetch(cfg_src.value)
+                self.single_flight('checker', self.cfg_fetch, cfg_src.value)
         elif event.button.id == 'fetch_button':
             cmds = self.query_one("#cmds")
+            remote_filter = self.query_one("#remote_filter").value
+            try:
+                remote_pipe(remote_filter)
+            except ValueError as exc:
+                self.notify(str(exc), severity='error')
+                return
             if cmds.value:
-                self.cmd_fetch(cmds.value)
+                self.single_flight('checker', self.cmd_fetch, cmds.value, remote_filter)
         elif event.button.id == 'generate':
             device_name = self.query_one("#device_name2")
             if self.query_one(RadioSet).pressed_index == 0:
-                self.checks_generate(device_name.value, 'terse')
+                self.single_flight('gen', self.checks_generate, device_name.value, 'terse')
             elif self.query_one(RadioSet).pressed_index == 1:
-                self.checks_generate(device_name.value, 'verbose')
-
-    @work
+                self.single_flight('gen', self.checks_generate, device_name.value, 'verbose')
+        elif event.button.id in ('pre_button', 'post_button'):
+            targets = self.query_one("#check_devices").value
+            if targets.strip():
+                level = 'terse' if self.query_one(RadioSet).pressed_index == 0 else 'verbose'
+                window = self.query_one("#check_window").value.strip() or str(today)
+                phase = 'pre' if event.button.id == 'pre_button' else 'post'
+                self.single_flight('gen', self.checks_run, targets, window, phase, level)
+        elif event.button.id == 'trace_refresh':
+            self.show_latency()
+        elif event.button.id == 'trace_export':
+            path = os.path.join(cache_dir, 'traces', f'trace_{datetime.datetime.now():%Y%m%d_%H%M%S}.json')
+            self.notify(f'{tracer.export(path)} spans exported to {path}')
+        elif event.button.id == 'hist_button':
+            self.history_browse(self.query_one("#hist_device").value.strip(), self.query_one("#hist_cmd").value.strip())
+
+    # Static widget and the RPCs needed to render it, a panel is rendered as soon as all of its RPCs are back
+    DASH_PANELS = {
+        'sys_panel': (('facts', 'alarms'), sys_info_table),
+        'mem_cpu_panel': (('memory', 'cpu'), mem_cpu_table),
+        'commit_panel': (('commit',), commit_table),
+    }
+
+    def single_flight(self, group, worker_method, *args):
+        """
+        Starts the worker unless the same query is already running in the group, in which case the
+        running one is shared. Workers are exclusive in their group, so a new query cancels the
+        older one along with the device RPCs it hasn't sent yet.
+        """
+        key = (worker_method.__name__, args)
+        running = self.flights.get(group)
+        if running and running[0] == key and running[1].state in (WorkerState.PENDING, WorkerState.RUNNING):
+            self.notify('Same query is already running')
+            return
+        self.flights[group] = (key, worker_method(*args))
+
+    def bind_cancel(self):
+        """
+        Waits for the inventory, if the worker is started before it's loaded, and returns the
+        worker. The nornir runs it starts are cancelled with it, see worker_cancel_check.
+        """
+        inventory_ready.wait()
+        return get_current_worker()
+
+    @work(exclusive=True, group='dash')
     def dasbboard_build(self, device_name):
-        self.query_one("#static1_1", Static).update('')
+        worker = self.bind_cancel()
+        self.call_from_thread(self.dash_reset, device_name)
         self.query_one('#load1').display = True
         new_nr = nr.filter(site=device_name)
-        main_result = new_nr.run(task=main_task)
-        facts_data = main_result[device_name][1].result
-        version = facts_data.get('version')
-        model = facts_data.get('model')
-        serial_num = facts_data.get('serialnumber')
-        re0 = facts_data.get('RE0')
-        re1 = facts_data.get('RE1')  # Returns None if RE1 is not present
-        if re0:
-            re0_uptime = re0.get('up_time')
-            re0_last_reboot_reason = re0.get('last_reboot_reason')
-        else:
-            re0_uptime = 'NA'
-            re0_last_reboot_reason = 'NA'
-        if re1:
-            re1_uptime = re1.get('up_time')
-            re1_last_reboot_reason = re1.get('last_reboot_reason')
-        else:
-            re1_uptime = 'NA'
-            re1_last_reboot_reason = 'NA'
-        # Extracting active alarms information
-        alarms_data = main_result[device_name][2].result
-        alarms_list_final = []
-        try:
-            alarms_var = alarms_data.get('alarm-information')['alarm-detail']
-            if isinstance(alarms_var, list):
-                for alarm in alarms_var:
-                    alarms_list_final.append(alarm['alarm-description'])
-            else:
-                alarms_list_final.append(alarms_var['alarm-description'])
-        except KeyError:
-            alarms_list_final.append("None")
-
-        sys_info_table = Table(show_lines=True, show_header=False, box=box.ASCII, title='System Information')
-        sys_info_table.add_column("Field", justify="right", style="magenta", width=18)
-        sys_info_table.add_column("Details", style="cyan", width=50)
-        sys_info_table.add_row('SW version', version)
-        sys_info_table.add_row('Model', model)
-        sys_info_table.add_row('Serial Number', serial_num)
-        sys_info_table.add_row('RE0 uptime', re0_uptime)
-        sys_info_table.add_row('RE0 last reboot reason', re0_last_reboot_reason)
-        sys_info_table.add_row('RE1 uptime', re1_uptime)
-        sys_info_table.add_row('RE1 last reload reason', re1_last_reboot_reason)
-
-        for alarm in alarms_list_final:
-            sys_info_table.add_row('Active alarms', alarm)
-
-        # Extracting CPU and memory info
-        used_value, free_value, cpu_usage_list = [], [], [],
-        memory_data = main_result[device_name][4].result
-        free_mem = memory_data['system-memory-information']['system-memory-summary-information'][
-            'system-memory-free-percent']
-        free_mem_int = int(re.sub('%', '', free_mem))
-        used_mem = 100 - free_mem_int
-        used_value.append(used_mem)
-        free_value.append(free_mem_int)
-
-        cpu_data = main_result[device_name][5].result
-        cpu_check = cpu_data['route-engine-information']['route-engine']
-        if isinstance(cpu_check, dict):  # This means device is having single RE
-            cpu_usage = cpu_data['route-engine-information']['route-engine']['cpu-user']
-            cpu_usage_list.append(int(cpu_usage))
-        elif isinstance(cpu_check, list):  # This means device is having dual REs
-            cpu_usage = cpu_data['route-engine-information']['route-engine'][0]['cpu-user']
-            cpu_usage_list.append(int(cpu_usage))
-
-        mem_cpu_table = Table(show_header=False, box=box.ASCII, width=50, title='Memory & CPU Information')
-        mem_cpu_table.add_column("Field", justify="left", style="magenta")
-        mem_cpu_table.add_column("Values", justify="left", style="cyan")
-        mem_cpu_table.add_row("[cyan]CPU in use[/cyan]", f"[green]{str(cpu_usage)}%")
-        mem_cpu_table.add_row("[cyan]\nMemory in use[/cyan]", f"\n[green]{str(used_mem)}%")
-
-        # Extracting commit info
-        commit_data = main_result[device_name][6].result
-        commit_user = commit_data['commit-information']['commit-history'][0]['user']
-        commit_time = commit_data['commit-information']['commit-history'][0]['date-time']['#text']
-
-        commit_table = Table(show_header=False, box=box.ASCII, width=50, title='Commit Information', style="blue")
-        commit_table.add_column("Field", justify="left")
-        commit_table.add_row("[cyan]Last commit by [/cyan]", f"[green]{commit_user}")
-        commit_table.add_row("[cyan]\nLast commit at [/cyan]", f"\n[green]{commit_time}")
-
-        mem_cpu_commit_table = Table(show_header=False, box=box.ASCII, width=53, show_edge=False)
-        mem_cpu_commit_table.add_column("Field", justify="left", style="magenta")
-        mem_cpu_commit_table.add_row(mem_cpu_table)
-        mem_cpu_commit_table.add_row("\n")
-        mem_cpu_commit_table.add_row(commit_table)
-
-        # Extracting routing Protocols Info
-        protocols_table = Table(show_lines=True, show_header=False, box=box.ASCII, width=47,
-                                title='Protocol Information')
-        protocols_table.add_column("Field", justify="right", style="magenta")
-        protocols_table.add_column("Details", style="cyan")
-        protocols = protocol_list(new_nr, device_name)
-        if 'bgp' in protocols:
-            bgp_result = new_nr.run(name='bgp', task=pyez_rpc, func='get-bgp-summary-information')
-            bgp_data = bgp_result[device_name][0].result
-            total_peers = bgp_data['bgp-information']['peer-count']
-            down_peers = bgp_data['bgp-information']['down-peer-count']
-            protocols_table.add_row("BGP Peer UP count", str(int(total_peers) - int(down_peers)))
-            protocols_table.add_row("[yellow]BGP Peer DOWN count", down_peers)
-        if 'isis' in protocols:
-            isis_result = new_nr.run(name='isis', task=pyez_rpc, func='get-isis-adjacency-information')
-            isis_data = isis_result[device_name][0].result
-            adj_up_count = 0
-            adj_down_count = 0
-            isis_list = isis_data['isis-adjacency-information']['isis-adjacency']
-            if isinstance(isis_list, list):
-                for adj in isis_list:
-                    if adj.get('adjacency-state') == 'Up':
-                        adj_up_count = adj_up_count + 1
-                    else:
-                        adj_down_count = adj_down_count + 1
-            else:
-                if isis_list['adjacency-state'] == 'Up':
-                    adj_up_count = adj_up_count + 1
-                else:
-                    adj_down_count = adj_down_count + 1
-            protocols_table.add_row("ISIS Adj UP count", str(adj_up_count))
-            protocols_table.add_row("[yellow]ISIS Adj DOWN count", str(adj_down_count))
-        if 'ospf' in protocols:
-            ospf_result = new_nr.run(name='ospf', task=pyez_rpc, func='get-ospf-neighbor-information')
-            ospf_data = ospf_result[device_name][0].result
-            ospf_full_count = 0
-            ospf_down_count = 0
-            ospf_nbr_list = ospf_data['ospf-neighbor-information']['ospf-neighbor']
-            if isinstance(ospf_nbr_list, list):
-                for nbr in ospf_nbr_list:
-                    if nbr.get('ospf-neighbor-state') == 'Full':
-                        ospf_full_count = ospf_full_count + 1
-                    else:
-                        ospf_down_count = ospf_down_count + 1
-            else:
-                if ospf_nbr_list['ospf-neighbor-state'] == 'Full':
-                    ospf_full_count = ospf_full_count + 1
-                else:
-                    ospf_down_count = ospf_down_count + 1
-            protocols_table.add_row("OSPF Nbr UP/Full count", str(ospf_full_count))
-            protocols_table.add_row("[yellow]OSPF Nbr DOWN count", str(ospf_down_count))
-        if 'mpls' in protocols:
-            mpls_result = new_nr.run(name='mpls', task=pyez_rpc, func='get-mpls-lsp-information')
-            mpls_data = mpls_result[device_name][0].result
-            lsp_data = mpls_data['mpls-lsp-information']['rsvp-session-data']
-            lsp_up_dict = {}
-            lsp_down_dict = {}
-            for lsp_type in lsp_data:
-                lsp_up_dict[lsp_type['session-type']] = lsp_type['up-count']
-                lsp_down_dict[lsp_type['session-type']] = lsp_type['down-count']
-            protocols_table.add_row("MPLS Ingress LSP UP count", str(lsp_up_dict['Ingress']))
-            protocols_table.add_row("[yellow]MPLS Ingress LSP DOWN count", str(lsp_down_dict['Ingress']))
-            protocols_table.add_row("MPLS Egress LSP UP count", str(lsp_up_dict['Egress']))
-            protocols_table.add_row("[yellow]MPLS Egress LSP DOWN count", str(lsp_down_dict['Egress']))
-            protocols_table.add_row("MPLS Transit LSP UP count", str(lsp_up_dict['Transit']))
-            protocols_table.add_row("[yellow]MPLS Transit LSP DOWN count", str(lsp_down_dict['Transit']))
-        if 'ldp' in protocols:
-            ldp_result = new_nr.run(name='ldp', task=pyez_rpc, func='get-ldp-session-information')
-            ldp_data = ldp_result[device_name][0].result
-            ldp_session = ldp_data['ldp-session-information']['ldp-session']
-            ldp_up_count = 0
-            ldp_down_count = 0
-            if isinstance(ldp_session, list):
-                for ldp_nbr in ldp_session:
-                    if ldp_nbr.get('ldp-session-state') == 'Operational':
-                        ldp_up_count = ldp_up_count + 1
-                    else:
-                        ldp_down_count = ldp_down_count + 1
-            else:
-                if ldp_session.get('ldp-session-state') == 'Operational':
-                    ldp_up_count = ldp_up_count + 1
-                else:
-                    ldp_down_count = ldp_down_count + 1
-            protocols_table.add_row("LDP Session Operational count", str(ldp_up_count))
-            protocols_table.add_row("[yellow]LDP Session Non-Operational count", str(ldp_down_count))
-        # Extracting route information
-        route_data = main_result[device_name][3].result
-        # rib_count = route_data['route-summary-information']['routing-highwatermark']['rt-all-highwatermark']
-        # fib_count = route_data['route-summary-information']['routing-highwatermark']['rt-fib-highwatermark']
-        # protocols_table.add_row("RIB routes", rib_count)
-        # protocols_table.add_row("FIB routes", fib_count)
-        main_table = Table(show_lines=True, show_header=False, title=f'[bold]{device_name} :: {today}')
-        main_table.add_column(justify="right", style="magenta")
-        main_table.add_column(justify="right", style="green")
-        main_table.add_column(justify="right", style="magenta")
-        main_table.add_row(sys_info_table, protocols_table, mem_cpu_commit_table)
 
+        def on_panel(name, data, seconds):
+            if not worker.is_cancelled:
+                self.call_from_thread(self.show_panel, name, data)
+
+        main_result = new_nr.run(task=main_task, on_panel=on_panel, on_failed=True)
+        if worker.is_cancelled:
+            return
         self.query_one('#load1').display = False
-        self.query_one("#static1_1", Static).update(main_table)
+        if main_result[device_name].failed:
+            self.query_one("#dash_title", Static).update(
+                f'[bold]{device_name} :: {today}\n[red]{main_result[device_name].exception}')
+            return
+        self.query_one("#dash_latency", Static).update(latency_table(main_result[device_name][0].result['latency']))
+
+    def dash_reset(self, device_name, note=''):
+        """Clears the dashboard panels for a new device"""
+        self.dash_device = device_name
+        self.dash_data = {}
+        self.dash_rows = {}
+        for panel in ('sys_panel', 'proto_panel', 'mem_cpu_panel', 'commit_panel', 'dash_latency'):
+            self.query_one(f"#{panel}", Static).update('')
+        self.query_one("#dash_title", Static).update(f'[bold]{device_name} :: {today} {note}')
+        self.show_trends(device_name)
+
+    def toggle_live(self, device_name):
+        """Starts polling the dashboard RPCs of the device every interval_seconds, or stops the polling"""
+        button = self.query_one("#live_button", Button)
+        if self.live_device:
+            self.live_device = None
+            if self.live_worker:
+                self.live_worker.cancel()
+            button.label = 'Go Live'
+            return
+        if not inventory_ready.is_set():
+            self.notify('Inventory is still loading')
+            return
+        if device_name not in nr.inventory.hosts:
+            self.notify(f'{device_name} not found in the inventory')
+            return
+        self.live_device = device_name
+        # First poll looks up the facts and protocols, the later ones only fetch what can change
+        self.live_protocols.pop(device_name, None)
+        self.live_next[device_name] = 0
+        button.label = 'Stop Live'
+        self.dash_reset(device_name, '(live)')
+
+    def live_tick(self):
+        """Starts the next poll of the live device once it's due, never while the previous poll is running"""
+        device_name = self.live_device
+        if not device_name or time.monotonic() < self.live_next.get(device_name, 0):
+            return
+        if self.live_worker and self.live_worker.state in (WorkerState.PENDING, WorkerState.RUNNING):
+            return
+        self.live_worker = self.live_poll(device_name)
+
+    @work(exclusive=True, group='live')
+    def live_poll(self, device_name):
+        worker = self.bind_cancel()
+        result = nr.filter(site=device_name).run(task=main_task, protocols=self.live_protocols.get(device_name),
+                                                 on_failed=True)
+        if not worker.is_cancelled:
+            self.call_from_thread(self.live_update, device_name, result[device_name])
+
+    def live_update(self, device_name, multi_result):
+        """Records the poll in the metric history and re-renders the dashboard panels which changed"""
+        interval = live_settings.get('interval_seconds', 10)
+        if multi_result.failed:
+            # Backing off exponentially from a device which isn't answering
+            failures = self.live_failures[device_name] = self.live_failures.get(device_name, 0) + 1
+            delay = min(interval * 2 ** failures, live_settings.get('max_backoff_seconds', 300))
+            self.live_next[device_name] = time.monotonic() + delay
+            if self.dash_device == device_name:
+                self.query_one("#dash_title", Static).update(
+                    f'[bold]{device_name} :: {today} (live)\n[red]{multi_result.exception}, retrying in {delay}s')
+            return
+        self.live_failures[device_name] = 0
+        self.live_next[device_name] = time.monotonic() + interval
+        panel_data = multi_result[0].result['data']
+        if isinstance(panel_data.get('protocols'), list):
+            self.live_protocols[device_name] = panel_data['protocols']
+        summary = health_summary(panel_data)
+        metric_history.add(device_name, {metric: summary[metric] for metric in LIVE_METRICS})
+        if self.dash_device != device_name:
+            return
+        self.query_one("#dash_title", Static).update(
+            f'[bold]{device_name} :: {today} (live, {datetime.datetime.now():%H:%M:%S})')
+        for name, data in panel_data.items():
+            if isinstance(data, Exception) or self.dash_data.get(name) != data:
+                self.show_panel(name, data)
+        self.query_one("#dash_latency", Static).update(latency_table(multi_result[0].result['latency']))
+        self.show_trends(device_name)
+
+    def show_trends(self, device_name):
+        for metric, label in LIVE_TRENDS:
+            values = metric_history.get(device_name, metric)
+            self.query_one(f"#{metric}_trend", Sparkline).data = values
+            self.query_one(f"#{metric}_label", Static).update(f"{label}: {values[-1] if values else '-'}")
+
+    def show_panel(self, name, data):
+        """Renders every dashboard panel which has all of its RPCs back"""
+        self.dash_data[name] = data
+        if name in PROTOCOL_RPCS or name == 'protocols':
+            if isinstance(data, Exception):
+                self.dash_rows[name] = [(f"[red]{name} failed", str(data))]
+            elif name in PROTOCOL_RPCS:
+                try:
+                    self.dash_rows[name] = protocol_rows(name, data)
+                except (KeyError, TypeError, AttributeError):
+                    self.dash_rows[name] = [(f"[yellow]{name}", "NA")]
+            rows = []
+            for protocol in self.dash_rows:
+                rows.extend(self.dash_rows[protocol])
+            with tracer.span(self.dash_device, 'build', 'proto_panel'):
+                self.query_one("#proto_panel", Static).update(protocols_table(rows))
+            return
+        for panel, (rpcs, build_table) in self.DASH_PANELS.items():
+            if name not in rpcs or not all(rpc in self.dash_data for rpc in rpcs):
+                continue
+            failed = [rpc for rpc in rpcs if isinstance(self.dash_data[rpc], Exception)]
+            if failed:
+                self.query_one(f"#{panel}", Static).update(
+                    f"[red]{', '.join(failed)} failed: {self.dash_data[failed[0]]}")
+                continue
+            try:
+                with tracer.span(self.dash_device, 'build', panel):
+                    self.query_one(f"#{panel}", Static).update(build_table(*[self.dash_data[rpc] for rpc in rpcs]))
+            except (KeyError, TypeError, IndexError, AttributeError):
+                self.query_one(f"#{panel}", Static).update(f"[yellow]{panel} data not available")
+
+    @work(exclusive=True, group='fleet')
+    def fleet_build(self, group):
+        """Runs the dashboard RPCs across the group (whole inventory if blank), filling the fleet table as hosts finish"""
+        worker = self.bind_cancel()
+        fleet_nr = nr.filter(filter_func=lambda host: host.has_parent_group(group)) if group else nr
+        total = len(fleet_nr.inventory.hosts)
+        with self.fleet_lock:
+            self.fleet_pending = []
+        self.call_from_thread(self.fleet_start, total)
+
+        def host_done(router, result):
+            if worker.is_cancelled:
+                return
+            # Row is parsed here in the nornir thread, the UI thread only adds the cells
+            row = fleet_row(router, result)
+            with self.fleet_lock:
+                self.fleet_pending.append(row)
+
+        stream_run(fleet_nr, host_done, task=main_task)
+
+    def fleet_start(self, total):
+        self.fleet_rows = {}
+        self.fleet_total = total
+        self.query_one("#fleet_table", DataTable).clear()
+        self.show_fleet_progress()
+
+    def show_fleet_progress(self):
+        partial = sum(1 for row in self.fleet_rows.values() if row['status'].startswith('partial'))
+        failed = sum(1 for row in self.fleet_rows.values() if row['status'].startswith('failed'))
+        self.query_one("#fleet_progress", Static).update(
+            f"[green]done: {len(self.fleet_rows) - partial - failed}[/green]  "
+            f"[yellow]pending: {self.fleet_total - len(self.fleet_rows)}[/yellow]  "
+            f"[yellow]partial: {partial}[/yellow]  [red]failed: {failed}[/red]")
+
+    def flush_fleet_rows(self):
+        """Adds the rows of the hosts finished since the last flush to the fleet table"""
+        with self.fleet_lock:
+            rows, self.fleet_pending = self.fleet_pending, []
+        if not rows:
+            return
+        table = self.query_one("#fleet_table", DataTable)
+        for row in rows:
+            with tracer.span(row['device'], 'build', 'fleet_row'):
+                if row['device'] in self.fleet_rows:
+                    table.remove_row(row['device'])
+                self.fleet_rows[row['device']] = row
+                table.add_row(*fleet_cells(row), key=row['device'])
+        self.show_fleet_progress()
+
+    def on_data_table_header_selected(self, event: DataTable.HeaderSelected) -> None:
+        """Sorts the fleet table on the column clicked, clicking the same column again reverses the order"""
+        if event.data_table.id != 'fleet_table':
+            return
+        key = FLEET_COLUMNS[event.column_index][0]
+        column, reverse = self.fleet_sort
+        self.fleet_sort = (key, not reverse if column == key else False)
+        # Hosts missing the value always go last
+        rows = sorted((row for row in self.fleet_rows.values() if row.get(key) is not None),
+                      key=lambda row: row[key], reverse=self.fleet_sort[1])
+        rows.extend(row for row in self.fleet_rows.values() if row.get(key) is None)
+        table = self.query_one("#fleet_table", DataTable)
+        table.clear()
+        for row in rows:
+            table.add_row(*fleet_cells(row), key=row['device'])
 
     def on_auto_complete_selected(self, event) -> None:
         """Run when user hits tab or enter after selecting the input from the dropdown"""
         user_input = self.query_one("#card_name")
+        # Every dropdown posts Selected, only the card one starts a lookup. The dropdowns are picked
+        # from with the keyboard, so the input of the dropdown is the one focused
+        if self.focused is not user_input:
+            return
         if user_input.value:
             # Get user input when user hits tab
-            self.card_fetch(user_input.value)
+            self.single_flight('checker', self.card_fetch, user_input.value)
+
+    @work(exclusive=True, group='hw_index')
+    def hw_index_refresh(self, max_age=None):
+        """Refreshes the hardware index for the devices indexed more than max_age seconds ago"""
+        self.bind_cancel()
+        refresh_hw_index(hw_index_age if max_age is None else max_age)
+
+    def action_refresh_hw(self):
+        self.hw_index_refresh(max_age=0)
+        self.notify('Refreshing hardware index')
+
+    def stream_start(self, total):
+        """Clears the output and starts a new streaming run across total hosts"""
+        self.stream_counts = {'completed': 0, 'pending': total, 'failed': 0}
+        self.query_one("#out", OutputViewer).reset()
+        self.show_progress()
+
+    def stream_write(self, text, host=None, done=0, failed=0):
+        """Appends the text to the output, can be called from the worker threads"""
+        self.call_from_thread(self.show_stream, text, host, done, failed)
+
+    def show_stream(self, text, host, done, failed):
+        self.stream_counts['completed'] += done
+        self.stream_counts['failed'] += failed
+        self.stream_counts['pending'] -= done + failed
+        if text:
+            self.query_one("#out", OutputViewer).append(text, host)
+        self.show_progress()
+
+    def stream_end(self, not_found_message):
+        if not get_current_worker().is_cancelled:
+            self.call_from_thread(self.finish_stream, not_found_message)
+
+    def finish_stream(self, not_found_message):
+        if not self.query_one("#out", OutputViewer).line_count():
+            self.query_one("#out", OutputViewer).append(not_found_message)
+        self.query_one('#load2').display = False
 
-    @work
+    def on_input_changed(self, event: Input.Changed) -> None:
+        """Searches the output as the user types, @host jumps to the output of the host"""
+        if event.input.id != 'out_search':
+            return
+        viewer = self.query_one("#out", OutputViewer)
+        if event.value.startswith('@'):
+            viewer.search('')
+            if event.value[1:]:
+                viewer.jump_to_host(event.value[1:])
+        else:
+            viewer.search(event.value, viewer.match_line or 0)
+
+    def on_input_submitted(self, event: Input.Submitted) -> None:
+        if event.input.id == 'out_search' and not event.value.startswith('@'):
+            if self.query_one("#out", OutputViewer).search_next() is None:
+                self.notify(f'{event.value} not found')
+
+    def show_progress(self):
+        counts = self.stream_counts
+        self.query_one("#progress", Static).update(
+            f"[green]completed: {counts['completed']}[/green]  [yellow]pending: {counts['pending']}[/yellow]  "
+            f"[red]failed: {counts['failed']}[/red]")
+
+    @work(exclusive=True, group='checker')
     def card_fetch(self, card_name):
+        worker = self.bind_cancel()
         self.query_one('#load2').display = True
-        card_search_output = nr.run(task=pyez_rpc, func='get-chassis-inventory')
-        router_list = list(dict.keys(card_search_output))
-        self.query_one('#load2').display = False
-        final_card_result = ''
-        for router in router_list:
-            card_result = card_search_output[router][0].result
-            module_list = card_result['chassis-inventory']['chassis']['chassis-module']
-            for module in module_list:
-                if 'FPC' in module['name'] and card_name == module['model-number']:
-                    final_card_result = f": {router} : {module['name']} > {module['model-number']}" + \
-                                        '\n' + final_card_result
-
-        if final_card_result != '':
-            self.query_one("#out", Static).update(Syntax(final_card_result, "teratermmacro",
-                                                         theme="vs", line_numbers=True))
-        else:
-            self.query_one("#out", Static).update(Syntax('Card Not Found!', "teratermmacro",
-                                                         theme="vs", line_numbers=True))
+        hosts = list(nr.inventory.hosts)
+        # Devices never indexed are fetched now, or waited for if the background refresh is already
+        # fetching them, rest are refreshed in the background
+        stale_hosts = hw_index.stale(hosts, float('inf'))
+        self.call_from_thread(self.stream_start, len(hosts))
+        matches = {}
+        for router, slot_path, serial in hw_index.lookup(card_name):
+            matches[router] = matches.get(router, '') + f": {router} : {slot_path} > {card_name} (SN {serial})\n"
+        for router in hosts:
+            if router not in stale_hosts:
+                self.stream_write(matches.get(router), router, done=1)
+
+        def host_done(router, result):
+            if worker.is_cancelled:
+                return
+            if result.failed:
+                self.stream_write(f": {router} : failed to fetch chassis inventory\n", router, failed=1)
+                return
+            card_result = ''
+            for slot_path, serial in [(entry[1], entry[2]) for entry in hw_index.lookup(card_name)
+                                      if entry[0] == router]:
+                card_result = card_result + f": {router} : {slot_path} > {card_name} (SN {serial})\n"
+            self.stream_write(card_result, router, done=1)
+
+        refresh_hw_index(float('inf'), on_host=host_done)
+        self.stream_end('Card Not Found!')
 
     @work
+    def cfg_index_build(self):
+        """Indexes the cached configs, so config searches work straight away even with devices unreachable"""
+        cfg_index.refresh(cfg_cache)
+
+    @work(exclusive=True, group='checker')
     def cfg_fetch(self, cfg_search):
+        worker = self.bind_cancel()
         self.query_one('#load2').display = True
-        cfg_search_output = nr.run(task=napalm_cli, commands=[f'show configuration | display set | match {cfg_search}'])
-        router_list = list(dict.keys(cfg_search_output))
-        cfg_search_result = ''
-        self.query_one('#load2').display = False
-        for router in router_list:
-            cfg_result = cfg_search_output[router][0].result
-            for key, value in cfg_result.items():
-                if value != "":
-                    cfg_search_result = cfg_search_result + f'~~ Config found in {router} ~~\n{value}\n\n'
-
-        self.query_one("#out", Static).update(Syntax(cfg_search_result, "teratermmacro",
-                                                     theme="vs", line_numbers=True))
-
-    @work
-    def cmd_fetch(self, cmds):
+        self.call_from_thread(self.stream_start, len(nr.inventory.hosts))
+        # Showing the matches from the cached configs straight away, so unreachable devices never hold up
+        # the results, only the devices committed since they were cached are shown again as they come in
+        cfg_index.refresh(cfg_cache)
+        cached = cfg_index.search(cfg_search)
+        cached_devices = set(cfg_index.device_commit)
+        for router, matched_lines in cached.items():
+            self.stream_write(cfg_search_text({router: matched_lines}, ' (cached)'), router)
+
+        def host_done(router, result):
+            if worker.is_cancelled:
+                return
+            if result.failed or not cfg_index.refresh(cfg_cache, devices=[router]):
+                self.stream_write(None, router, done=0 if result.failed else 1, failed=1 if result.failed else 0)
+                return
+            search_result = cfg_index.search(cfg_search, devices=[router])
+            note = ' (committed since cached)' if router in cached_devices else ''
+            text = cfg_search_text(search_result, note)
+            if not search_result and router in cached:
+                text = f'~~ Config no longer found in {router} (committed since cached) ~~\n\n'
+            self.stream_write(text, router, done=1)
+
+        stream_run(nr, host_done, task=config_task)
+        self.stream_end('Config Not Found!')
+
+    @work(exclusive=True, group='checker')
+    def cmd_fetch(self, cmds, remote_filter=''):
+        worker = self.bind_cancel()
         self.query_one('#load2').display = True
+        self.call_from_thread(self.stream_start, len(nr.inventory.hosts))
         cmds_list = cmds.split(',')
-        cmd_fetch_output = nr.run(task=napalm_cli, commands=cmds_list)
-        router_list = list(dict.keys(cmd_fetch_output))
-        self.query_one('#load2').display = False
-        cmd_fetch_result = ''
-        for router in router_list:
-            cmd_result = cmd_fetch_output[router][0].result
-            cmd_str = re.sub(" ", "_", cmds)
-            final_out = cmd_result[cmds]
-            cmd_fetch_result = cmd_fetch_result + f"^^^ {today}/{cmd_str}/{router} ^^^^\n\n{final_out.strip()}\n\n\n"
-        self.query_one("#out", Static).update(Syntax(cmd_fetch_result, "teratermmacro",
-                                                     theme="vs", line_numbers=True))
-
-    @work
+        cmd_str = re.sub(" ", "_", cmds)
+        # Filter is applied on the device, so only the matching lines cross the wire
+        pipe = remote_pipe(remote_filter)
+        transfer = {'received': 0, 'saved': 0}
+        transfer_lock = threading.Lock()
+
+        def host_done(router, result):
+            if worker.is_cancelled:
+                return
+            if result.failed:
+                self.stream_write(f"^^^ {today}/{cmd_str}/{router} ^^^^\n\nFailed: {result.exception}\n\n\n", router,
+                                  failed=1)
+                return
+            cmd_result = result[0].result
+            for cmd in cmds_list:
+                received = len(cmd_result[cmd + pipe].encode())
+                saved = transfer_stats.record(f'cli {cmd.strip()}', router, received, filtered=bool(pipe))
+                with transfer_lock:
+                    transfer['received'] += received
+                    transfer['saved'] += saved
+            archive.put_many(router, {cmd + pipe: cmd_result[cmd + pipe] for cmd in cmds_list}, 'checker')
+            final_out = '\n'.join(cmd_result[cmd + pipe] for cmd in cmds_list)
+            self.stream_write(f"^^^ {today}/{cmd_str}/{router} ^^^^\n\n{final_out.strip()}\n\n\n", router, done=1)
+
+        stream_run(nr, host_done, task=cli_task, commands=[cmd + pipe for cmd in cmds_list])
+        transfer_stats.save()
+        self.stream_end('No output!')
+        if pipe and not worker.is_cancelled:
+            self.call_from_thread(self.notify, f"Received {human_bytes(transfer['received'])}, remote filter saved "
+                                               f"{human_bytes(transfer['saved'])}")
+
+    @work(exclusive=True, group='gen')
     def checks_generate(self, device_name, level):
-        self.query_one("#gen_out", Static).update('')
+        worker = self.bind_cancel()
+        self.call_from_thread(self.query_one("#gen_out", OutputViewer).reset)
         self.query_one('#load3').display = True
         new_nr = nr.filter(site=device_name)
-        unique_protocols = protocol_list(new_nr, device_name)
+        unique_protocols, received = protocol_list(new_nr, device_name)
+        if worker.is_cancelled:
+            return
+        if received:
+            self.call_from_thread(self.notify, f'Fetched {human_bytes(received)} of protocols config')
 
         # Loading cmds.yaml
-        with open("cmds.yml", "r") as f:
-            try:
-                all_cmds = yaml.safe_load(f)
-            except yaml.YAMLError as exc:
-                print(exc)
+        try:
+            all_cmds = load_check_cmds()
+        except yaml.YAMLError as exc:
+            print(exc)
+            all_cmds = {}
 
-        cmds_list = []
-        protocols_na = ''
-        for protocol in unique_protocols:
-            try:
-                cmds_list.append(all_cmds[protocol][level])
-            except KeyError:
-                protocols_na += protocol + '\n'
+        cmds_list, protocols_na = check_commands(all_cmds, unique_protocols, level)
         self.query_one('#load3').display = False
-        self.query_one("#gen_out", Static).update(Syntax
-                                                  (f'Checks are not available for following protocols\n{protocols_na}',
-                                                   "teratermmacro", theme="vs", line_numbers=True))
+        self.call_from_thread(self.query_one("#gen_out", OutputViewer).load_text,
+                              'Checks are not available for following protocols\n' + '\n'.join(protocols_na))
         global final_cmds
         final_cmds = ''
-        for cmds in cmds_list:
-            for c in cmds:
-                final_cmds += c + '\n'
+        for c in cmds_list:
+            final_cmds += c + '\n'
+
+        self.call_from_thread(self.query_one("#gen_out", OutputViewer).load_text, final_cmds)
+
+    @work(exclusive=True, group='gen')
+    def checks_run(self, targets, window, phase, level):
+        """
+        Runs the generated checks across the target devices at once and saves them as the pre or
+        post snapshot of the change window. Post checks are diffed against the pre checks of the
+        window as soon as each device is done.
+        """
+        worker = self.bind_cancel()
+        gen_out = self.query_one("#gen_out", OutputViewer)
+        self.call_from_thread(gen_out.reset)
+        window_dir = os.path.join(cache_dir, 'checks', safe_name(window))
+        snapshot_dir = os.path.join(window_dir, phase)
+        os.makedirs(snapshot_dir, exist_ok=True)
+        target_nr = target_nornir(targets)
+        if not target_nr.inventory.hosts:
+            self.call_from_thread(gen_out.load_text, f'No devices matching {targets}')
+            return
+        self.query_one('#load3').display = True
+        # Keeps the diff of each device together in the output
+        write_lock = threading.Lock()
+
+        def write(text):
+            self.call_from_thread(gen_out.append, text)
+
+        def host_done(router, result):
+            if worker.is_cancelled:
+                return
+            with write_lock:
+                if result.failed:
+                    write(f'!! {router}: {phase} checks failed: {result.exception}\n')
+                    return
+                path = result[0].result
+                pre_path = os.path.join(window_dir, 'pre', os.path.basename(path))
+                if phase == 'pre':
+                    write(f'== {router}: pre checks saved to {path}\n')
+                    return
+                if not os.path.exists(pre_path):
+                    write(f'!! {router}: no pre checks for {window} to compare with\n')
+                    return
+                # Diff is written out in chunks as it's generated, never held in full
+                chunk = [f'== {router}: changes since the pre checks\n']
+                changed = False
+                for line in diff_snapshots(pre_path, path):
+                    changed = True
+                    chunk.append(line + '\n')
+                    if len(chunk) >= 500:
+                        write(''.join(chunk))
+                        chunk = []
+                if not changed:
+                    chunk.append('   no changes\n')
+                write(''.join(chunk))
+
+        stream_run(target_nr, host_done, task=checks_task, all_cmds=load_check_cmds(), level=level,
+                   snapshot_dir=snapshot_dir)
+        if not worker.is_cancelled:
+            self.query_one('#load3').display = False
 
-        self.query_one("#gen_out", Static).update(Syntax(final_cmds, "teratermmacro",
-                                                         theme="vs", line_numbers=True))
+    def on_tabbed_content_tab_activated(self, event: TabbedContent.TabActivated) -> None:
+        if event.tabbed_content.active == 'latency':
+            self.show_latency()
+
+    def show_latency(self):
+        """Renders the slowest hosts and the per RPC percentiles of the spans traced so far"""
+        self.query_one("#trace_hosts", Static).update(slow_hosts_table(tracer.slowest_hosts()))
+        self.query_one("#trace_rpcs", Static).update(rpc_stats_table(tracer.rpc_stats()))
+        self.query_one("#trace_note", Static).update(f'{len(tracer.spans)} spans traced')
+
+    @work(exclusive=True, group='history')
+    def history_browse(self, device_name, command):
+        inventory_ready.wait()
+        rows = archive.history(device_name, command)
+        outputs, distinct, raw, stored = archive.stats()
+        self.call_from_thread(self.show_history, rows,
+                              f'{outputs} outputs archived, {distinct} distinct, '
+                              f'{human_bytes(raw)} stored in {human_bytes(stored)}')
+
+    def show_history(self, rows, stats):
+        self.hist_rows = rows
+        self.query_one("#hist_stats", Static).update(stats)
+        table = self.query_one("#hist_table", DataTable)
+        table.clear()
+        for row_no, (collected, device, command, source, _, size) in enumerate(rows):
+            table.add_row(datetime.datetime.fromtimestamp(collected).strftime('%Y-%m-%d %H:%M:%S'), device, command,
+                          source, human_bytes(size), key=str(row_no))
+        if not rows:
+            self.query_one("#hist_out", OutputViewer).load_text('Nothing archived matching the search')
+
+    def on_data_table_row_selected(self, event: DataTable.RowSelected) -> None:
+        """Loads the archived output of the history row selected"""
+        if event.data_table.id != 'hist_table':
+            return
+        collected, device, command, source, digest, _ = self.hist_rows[int(event.row_key.value)]
+        self.query_one("#hist_out", OutputViewer).load_text(f'**** {command} ***\n{archive.get(digest)}')
 
-    @work
     def action_fetch_output(self):
         if self.query_one(TabbedContent).active == "gen":
-            self.query_one("#gen_out", Static).update('')
-            device_name = self.query_one("#device_name2").value
-            self.query_one('#load3').display = True
-            new_nr = nr.filter(site=device_name)
-            commands = final_cmds.splitlines()
-            fetch_result = new_nr.run(task=napalm_cli, commands=commands)
-            fetch_output = fetch_result[device_name][0].result
-            self.query_one('#load3').display = False
-            for key, value in fetch_output.items():
-                with open(f"{device_name}_{today}_cmd_output.txt", 'a') as f:
-                    f.write(f"**** {key} ***\n{value}")
-
-            self.query_one("#gen_out", Static).update(
-                Syntax(
-                    f'Output from {device_name} saved to {device_name}_{today}_cmd_output.txt',
-                    "teratermmacro", theme="vs", line_numbers=False))
-        else:
-            pass
+            self.single_flight('gen', self.fetch_output, self.query_one("#device_name2").value)
+
+    @work(exclusive=True, group='gen')
+    def fetch_output(self, device_name):
+        worker = self.bind_cancel()
+        self.call_from_thread(self.query_one("#gen_out", OutputViewer).reset)
+        self.query_one('#load3').display = True
+        new_nr = nr.filter(site=device_name)
+        commands = final_cmds.splitlines()
+        fetch_result = new_nr.run(task=cli_task, commands=commands, on_failed=True)
+        if worker.is_cancelled:
+            return
+        self.query_one('#load3').display = False
+        if fetch_result[device_name].failed:
+            self.call_from_thread(self.query_one("#gen_out", OutputViewer).load_text,
+                                  f'Failed to fetch output from {device_name}: {fetch_result[device_name].exception}')
+            return
+        fetch_output = fetch_result[device_name][0].result
+        new = archive.put_many(device_name, fetch_output, 'generator')
+        self.call_from_thread(self.query_one("#gen_out", OutputViewer).load_text,
+                              ''.join(f"**** {key} ***\n{value}\n" for key, value in fetch_output.items()))
+        self.call_from_thread(self.notify, f'Output from {device_name} archived, {new} of {len(fetch_output)} '
+                                           f'outputs changed since the last fetch')
 
     def action_copy_cmds(self):
+        import pyperclip
         pyperclip.copy(final_cmds)
         if self.query_one(TabbedContent).active == "gen":
             # self.query_one("#gen_out", Static).update('commands copied to clipboard!')
@@ -513,7 +1522,7 @@ class NetTUI(App):
     def action_save_snap(self):
         if self.query_one(TabbedContent).active == "dash":
             console.save_svg("dash.svg", title="dash_snap")
-            self.query_one("#static1_1", Static).update("Dashboard snapshot saved")
+            self.query_one("#dash_title", Static).update("Dashboard snapshot saved")
         else:
             pass
 
@@ -521,3 +1530,5 @@ class NetTUI(App):
 if __name__ == "__main__":
     app = NetTUI()
     app.run()
+    if pool:
+        pool.stop()
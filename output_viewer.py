@@ -0,0 +1,163 @@
+import mmap
+import os
+import re
+from array import array
+from bisect import bisect_right
+
+from rich.segment import Segment
+from rich.style import Style
+from rich.syntax import Syntax
+from textual.geometry import Size
+from textual.scroll_view import ScrollView
+from textual.strip import Strip
+
+
+class OutputViewer(ScrollView, can_focus=True):
+    """
+    Output widget for huge outputs. Output is appended to a file on disk and read back
+    through mmap, only the lines visible on the screen are highlighted and rendered.
+    """
+
+    def __init__(self, path, lexer="teratermmacro", theme="vs", *, id=None):
+        super().__init__(id=id)
+        self.path = path
+        self.syntax = Syntax('', lexer, theme=theme)
+        self.file = None
+        self.mm = None
+        self.mm_size = 0
+        self.size_written = 0
+        self.offsets = array('Q', [0])  # Start offset of each line in the file
+        self.max_width = 0
+        self.hosts = {}  # host -> first line of the host's output
+        self.search_query = ''
+        self.match_line = None
+        self.line_cache = {}
+
+    def reset(self):
+        """Clears the output and starts a new output file"""
+        self.close()
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self.file = open(self.path, 'w+b')
+        self.size_written = 0
+        self.offsets = array('Q', [0])
+        self.max_width = 0
+        self.hosts = {}
+        self.match_line = None
+        self.line_cache = {}
+        self.virtual_size = Size(0, 0)
+        self.scroll_to(0, 0, animate=False)
+        self.refresh()
+
+    def close(self):
+        if self.mm:
+            self.mm.close()
+            self.mm = None
+            self.mm_size = 0
+        if self.file:
+            self.file.close()
+            self.file = None
+
+    def append(self, text, host=None):
+        """Appends text to the output, host marks the start of the host's output for jump_to_host"""
+        if self.file is None:
+            self.reset()
+        if host is not None and host not in self.hosts:
+            self.hosts[host] = self.line_count()
+        data = text.replace('\t', '    ').encode()
+        self.file.write(data)
+        self.file.flush()
+        position = data.find(b'\n')
+        while position != -1:
+            self.offsets.append(self.size_written + position + 1)
+            position = data.find(b'\n', position + 1)
+        self.size_written += len(data)
+        for line in text.splitlines():
+            self.max_width = max(self.max_width, len(line))
+        self.virtual_size = Size(self.max_width + self.gutter_width() + 1, self.line_count())
+        self.refresh()
+
+    def load_text(self, text):
+        self.reset()
+        self.append(text)
+
+    def line_count(self):
+        if self.offsets[-1] == self.size_written:
+            return len(self.offsets) - 1
+        return len(self.offsets)
+
+    def gutter_width(self):
+        return len(str(max(self.line_count(), 1))) + 1
+
+    def get_line(self, line_no):
+        if self.mm_size != self.size_written:
+            # File has grown since it was mapped
+            if self.mm:
+                self.mm.close()
+            self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.mm_size = self.size_written
+        start = self.offsets[line_no]
+        end = self.offsets[line_no + 1] - 1 if line_no + 1 < len(self.offsets) else self.size_written
+        return self.mm[start:end].decode(errors='replace')
+
+    def render_line(self, y):
+        scroll_x, scroll_y = self.scroll_offset
+        line_no = scroll_y + y
+        width = self.size.width
+        if line_no >= self.line_count():
+            return Strip.blank(width, self.rich_style)
+        key = (line_no, scroll_x, width, self.virtual_size.width, self.search_query, self.match_line == line_no)
+        if key in self.line_cache:
+            return self.line_cache[key]
+        gutter = self.gutter_width()
+        text = self.syntax.highlight(self.get_line(line_no))
+        text.rstrip()
+        if self.search_query:
+            style = 'black on yellow' if self.match_line == line_no else 'reverse'
+            text.highlight_regex(re.escape(self.search_query), style)
+        segments = [Segment(f'{line_no + 1:>{gutter - 1}} ', Style(dim=True))]
+        segments.extend(text.render(self.app.console))
+        strip = Strip(segments).adjust_cell_length(max(self.virtual_size.width, width)).crop(
+            scroll_x, scroll_x + width)
+        if len(self.line_cache) > 1000:
+            self.line_cache.clear()
+        self.line_cache[key] = strip
+        return strip
+
+    def goto_line(self, line_no):
+        self.scroll_to(y=max(0, line_no - self.size.height // 2), animate=False)
+
+    def jump_to_host(self, host):
+        """Scrolls to the output of the first host matching host, returns the host found"""
+        for name, line_no in self.hosts.items():
+            if name.startswith(host):
+                self.goto_line(line_no)
+                return name
+        return None
+
+    def search(self, query, from_line=0):
+        """
+        Scrolls to the first line at or after from_line containing query, wrapping around to
+        the top. Returns the line number found or None.
+        """
+        self.search_query = query
+        self.match_line = None
+        self.line_cache = {}
+        self.refresh()
+        if not query or not self.size_written:
+            return None
+        self.get_line(0)  # Makes sure the whole file is mapped
+        needle = query.encode()
+        from_line = min(from_line, len(self.offsets) - 1)
+        position = self.mm.find(needle, self.offsets[from_line])
+        if position == -1:
+            position = self.mm.find(needle, 0)
+        if position == -1:
+            return None
+        self.match_line = bisect_right(self.offsets, position) - 1
+        self.goto_line(self.match_line)
+        return self.match_line
+
+    def search_next(self):
+        if self.match_line is None:
+            return self.search(self.search_query)
+        return self.search(self.search_query, self.match_line + 1)
@@ -0,0 +1,199 @@
+from dataclasses import dataclass
+
+from tracing import no_span
+
+
+@dataclass(slots=True)
+class Alarm:
+    description: str
+    severity: str
+
+
+@dataclass(slots=True)
+class RouteEngine:
+    slot: str
+    cpu_user: int
+    mastership: str
+
+
+@dataclass(slots=True)
+class SystemMemory:
+    free_percent: int
+
+
+@dataclass(slots=True)
+class RouteTable:
+    name: str
+    active_routes: int
+    total_routes: int
+
+
+@dataclass(slots=True)
+class Commit:
+    user: str
+    date_time: str
+    seconds: str
+
+
+@dataclass(slots=True)
+class BgpSummary:
+    peer_count: int
+    down_peer_count: int
+
+
+@dataclass(slots=True)
+class Adjacency:
+    """ISIS adjacency, OSPF neighbor or LDP session"""
+    neighbor: str
+    interface: str
+    state: str
+
+
+@dataclass(slots=True)
+class LspCount:
+    session_type: str
+    up: int
+    down: int
+
+
+@dataclass(slots=True)
+class ChassisModule:
+    model: str
+    slot_path: str
+    serial: str
+
+
+def text(element, path, default=''):
+    value = element.findtext(path)
+    return value.strip() if value is not None else default
+
+
+def number(element, path):
+    return int(text(element, path, '0').rstrip('%') or 0)
+
+
+def parse_alarms(reply):
+    return [Alarm(text(alarm, 'alarm-description'), text(alarm, 'alarm-class'))
+            for alarm in reply.iter('alarm-detail')]
+
+
+def parse_route_engines(reply):
+    return [RouteEngine(text(engine, 'slot'), number(engine, 'cpu-user'), text(engine, 'mastership-state'))
+            for engine in reply.iter('route-engine')]
+
+
+def parse_memory(reply):
+    for summary in reply.iter('system-memory-summary-information'):
+        return SystemMemory(number(summary, 'system-memory-free-percent'))
+    return None
+
+
+def parse_route_tables(reply):
+    return [RouteTable(text(table, 'table-name'), number(table, 'active-route-count'),
+                       number(table, 'total-route-count'))
+            for table in reply.iter('route-table')]
+
+
+def parse_commits(reply):
+    commits = []
+    for commit in reply.iter('commit-history'):
+        date_time = commit.find('date-time')
+        # Attribute is namespaced (junos:seconds), matching it by its local name
+        seconds = next((value for key, value in date_time.attrib.items() if key.endswith('seconds')), '') \
+            if date_time is not None else ''
+        commits.append(Commit(text(commit, 'user'), text(commit, 'date-time'), seconds))
+    return commits
+
+
+def parse_bgp(reply):
+    return BgpSummary(number(reply, 'peer-count'), number(reply, 'down-peer-count'))
+
+
+def parse_isis(reply):
+    return [Adjacency(text(adjacency, 'system-name'), text(adjacency, 'interface-name'),
+                      text(adjacency, 'adjacency-state'))
+            for adjacency in reply.iter('isis-adjacency')]
+
+
+def parse_ospf(reply):
+    return [Adjacency(text(neighbor, 'neighbor-address'), text(neighbor, 'interface-name'),
+                      text(neighbor, 'ospf-neighbor-state'))
+            for neighbor in reply.iter('ospf-neighbor')]
+
+
+def parse_ldp(reply):
+    return [Adjacency(text(session, 'ldp-neighbor-address'), '', text(session, 'ldp-session-state'))
+            for session in reply.iter('ldp-session')]
+
+
+def parse_lsps(reply):
+    return [LspCount(text(session, 'session-type'), number(session, 'up-count'), number(session, 'down-count'))
+            for session in reply.iter('rsvp-session-data')]
+
+
+# Nested chassis module levels in the get-chassis-inventory reply
+MODULE_LEVELS = ['chassis-module', 'chassis-sub-module', 'chassis-sub-sub-module', 'chassis-sub-sub-sub-module']
+
+
+def parse_chassis(reply, level=0, parent_path=''):
+    """Returns the modules having a model number, at every nesting level"""
+    modules = []
+    if level == len(MODULE_LEVELS):
+        return modules
+    parent = reply.find('chassis') if level == 0 else reply
+    if parent is None:
+        return modules
+    for module in parent.iterfind(MODULE_LEVELS[level]):
+        slot_path = f"{parent_path} > {text(module, 'name')}" if parent_path else text(module, 'name')
+        if text(module, 'model-number'):
+            modules.append(ChassisModule(text(module, 'model-number'), slot_path, text(module, 'serial-number', 'NA')))
+        modules.extend(parse_chassis(module, level + 1, slot_path))
+    return modules
+
+
+def chassis_filter():
+    module_filter = ''
+    for level in reversed(MODULE_LEVELS):
+        module_filter = f'<{level}><name/><model-number/><serial-number/>{module_filter}</{level}>'
+    return f'<chassis-inventory><chassis>{module_filter}</chassis></chassis-inventory>'
+
+
+# RPC -> (filter_xml, parser). Replies of the RPCs which can grow with the network (peers,
+# adjacencies, modules) are pruned to the fields needed by ncclient's SAX parser as they stream
+# in, so the full tree is never built (the napalm connection is opened with use_filter, see
+# conn_pool.SaxNapalm). Small replies are parsed as they are.
+RPC_PARSERS = {
+    'get-system-alarm-information': (None, parse_alarms),
+    'get-route-engine-information': (None, parse_route_engines),
+    'get-system-memory-information': (None, parse_memory),
+    'get-route-summary-information': (None, parse_route_tables),
+    'get-commit-information': (None, parse_commits),
+    'get-bgp-summary-information': (
+        '<bgp-information><peer-count/><down-peer-count/></bgp-information>', parse_bgp),
+    'get-isis-adjacency-information': (
+        '<isis-adjacency-information><isis-adjacency><interface-name/><system-name/><adjacency-state/>'
+        '</isis-adjacency></isis-adjacency-information>', parse_isis),
+    'get-ospf-neighbor-information': (
+        '<ospf-neighbor-information><ospf-neighbor><neighbor-address/><interface-name/><ospf-neighbor-state/>'
+        '</ospf-neighbor></ospf-neighbor-information>', parse_ospf),
+    'get-ldp-session-information': (
+        '<ldp-session-information><ldp-session><ldp-neighbor-address/><ldp-session-state/>'
+        '</ldp-session></ldp-session-information>', parse_ldp),
+    'get-mpls-lsp-information': (
+        '<mpls-lsp-information><rsvp-session-data><session-type/><up-count/><down-count/>'
+        '</rsvp-session-data></mpls-lsp-information>', parse_lsps),
+    'get-chassis-inventory': (chassis_filter(), parse_chassis),
+}
+
+
+def get_model(device, rpc, span=no_span):
+    """
+    Runs the RPC on the pyez device and returns its reply parsed into the models.
+    span(stage, rpc) times the RPC and the parsing, see tracing.Tracer.host_span.
+    """
+    filter_xml, parse = RPC_PARSERS[rpc]
+    func = getattr(device.rpc, rpc.replace('-', '_'))
+    with span('rpc', rpc):
+        reply = func(filter_xml=filter_xml) if filter_xml else func()
+    with span('parse', rpc):
+        return parse(reply)
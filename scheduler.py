@@ -0,0 +1,198 @@
+import queue
+import threading
+import time
+from collections import deque
+
+from nornir.core.task import AggregatedResult, MultiResult, Result
+
+
+class HostTimeout(Exception):
+    pass
+
+
+class CircuitOpen(Exception):
+    pass
+
+
+class RunCancelled(Exception):
+    pass
+
+
+def not_cancelled():
+    return False
+
+
+def no_cancel_check():
+    return not_cancelled
+
+
+# Returns the callable telling if the run started from the current thread has been cancelled
+cancel_check = no_cancel_check
+
+
+def set_cancel_check(check):
+    """
+    Sets the function called from the thread starting each run, returning the callable telling
+    if the run has been cancelled. Cancelled runs stop sending RPCs to the hosts not done yet
+    and return straight away.
+    """
+    global cancel_check
+    cancel_check = check
+
+
+# host -> [consecutive failures, time the breaker opened], shared across runs
+breakers = {}
+breakers_lock = threading.Lock()
+
+
+def failed_result(task, host, exception):
+    multi_result = MultiResult(task.name)
+    result = Result(host=host, result=str(exception), failed=True, exception=exception)
+    result.name = task.name
+    multi_result.append(result)
+    return multi_result
+
+
+def with_retries(func, retries, backoff, cancelled):
+    """Wraps the task function to retry it with exponential backoff, within the same Task"""
+    def attempt(task, **kwargs):
+        for attempt_no in range(retries + 1):
+            # Dropping the subtask results of the failed attempt
+            del task.results[:]
+            try:
+                return func(task, **kwargs)
+            except Exception:
+                if attempt_no == retries or cancelled():
+                    raise
+                time.sleep(backoff * 2 ** attempt_no)
+
+    attempt.__name__ = func.__name__
+    return attempt
+
+
+class AdaptiveRunner:
+    """
+    Nornir runner which adjusts the number of hosts run at once to the observed latency and
+    errors. Concurrency grows by ~1 for every num_workers hosts answering in time, and is cut
+    down by a quarter on every failure or timeout, always staying between min_workers and
+    max_workers.
+
+    Hosts not done within host_timeout seconds, or when the whole run goes past deadline
+    seconds, are returned as failed with HostTimeout, so the run always comes back with
+    partial results instead of waiting on a hung router. Failed hosts are retried with
+    exponential backoff, and hosts failing breaker_threshold runs in a row are skipped
+    with CircuitOpen for breaker_cooldown seconds. A run cancelled through
+    set_cancel_check returns straight away with the hosts not done as RunCancelled.
+
+    The runner is shared by the runs of its nornir object, runs going on at the same time
+    share the concurrency limit, so together they never have more hosts running than it.
+    """
+
+    def __init__(self, num_workers=10, min_workers=2, max_workers=50, host_timeout=120, deadline=600, retries=1,
+                 backoff=2, breaker_threshold=3, breaker_cooldown=300):
+        self.limit = num_workers
+        self.min_workers = min_workers
+        self.max_workers = max_workers
+        self.host_timeout = host_timeout
+        self.deadline = deadline
+        self.retries = retries
+        self.backoff = backoff
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self.avg_latency = None
+        self.running = 0  # hosts running across all the runs
+        self.lock = threading.Lock()
+        self.slot_freed = threading.Condition(self.lock)
+
+    def breaker_open(self, host):
+        with breakers_lock:
+            failures, opened_at = breakers.get(host.name, (0, None))
+            # Letting one run through once the cooldown is over
+            return failures >= self.breaker_threshold and time.time() - opened_at < self.breaker_cooldown
+
+    def record(self, host, failed, latency=None):
+        """Updates the circuit breaker of the host and the concurrency limit"""
+        with breakers_lock:
+            if failed:
+                failures = breakers.get(host.name, (0, None))[0] + 1
+                breakers[host.name] = (failures, time.time())
+            else:
+                breakers.pop(host.name, None)
+        with self.lock:
+            if failed:
+                self.limit = max(self.min_workers, self.limit * 0.75)
+                return
+            if self.avg_latency is None:
+                self.avg_latency = latency
+            if latency > 2 * self.avg_latency:
+                # Hosts slowing down, backing off a little
+                self.limit = max(self.min_workers, self.limit * 0.9)
+            else:
+                self.limit = min(self.max_workers, self.limit + 1 / self.limit)
+            self.avg_latency = 0.8 * self.avg_latency + 0.2 * latency
+
+    def release(self, count=1):
+        """Frees the slots of hosts done or given up on, for the runs waiting on one"""
+        with self.lock:
+            self.running -= count
+            self.slot_freed.notify_all()
+
+    def run(self, task, hosts):
+        result = AggregatedResult(task.name)
+        pending = deque(hosts)
+        running = {}  # host name -> (host, start time)
+        done_queue = queue.Queue()
+        run_deadline = time.monotonic() + self.deadline
+        cancelled = cancel_check()
+
+        def start(host_task, host):
+            done_queue.put((host, host_task.start(host)))
+
+        while pending or running:
+            if cancelled():
+                # Hosts running are left to finish in the background, nothing new is sent
+                for host in list(pending) + [host for host, _ in running.values()]:
+                    result[host.name] = failed_result(task, host, RunCancelled(f'{host.name} run cancelled'))
+                self.release(len(running))
+                break
+            now = time.monotonic()
+            with self.lock:
+                while pending and self.running < int(self.limit):
+                    host = pending.popleft()
+                    if self.breaker_open(host):
+                        result[host.name] = failed_result(task, host, CircuitOpen(
+                            f'{host.name} skipped, failed {self.breaker_threshold} runs in a row'))
+                    elif now > run_deadline:
+                        result[host.name] = failed_result(task, host, HostTimeout(f'{host.name} not run, deadline hit'))
+                    else:
+                        host_task = task.copy()
+                        host_task.task = with_retries(task.task, self.retries, self.backoff, cancelled)
+                        # Daemon threads, so a hung router can't keep the app from exiting
+                        threading.Thread(target=start, args=(host_task, host), daemon=True).start()
+                        running[host.name] = (host, now)
+                        self.running += 1
+                if not running:
+                    # Other runs are using every slot, waiting for one of them to free up
+                    if pending:
+                        self.slot_freed.wait(0.5)
+                    continue
+            wait_until = min(min(started for _, started in running.values()) + self.host_timeout, run_deadline,
+                             time.monotonic() + 0.5)  # Checking for cancellation every half a second
+            try:
+                host, multi_result = done_queue.get(timeout=max(0.0, wait_until - time.monotonic()))
+                if host.name in running:
+                    _, started = running.pop(host.name)
+                    self.release()
+                    result[host.name] = multi_result
+                    self.record(host, multi_result.failed, time.monotonic() - started)
+            except queue.Empty:
+                pass
+            now = time.monotonic()
+            for name, (host, started) in list(running.items()):
+                if now - started > self.host_timeout or now > run_deadline:
+                    running.pop(name)
+                    self.release()
+                    result[name] = failed_result(task, host, HostTimeout(
+                        f'{name} timed out after {now - started:.0f} seconds'))
+                    self.record(host, True)
+        return result
@@ -0,0 +1,148 @@
+import pytest
+
+from checks import diff_snapshots, normalize, write_snapshot
+
+BGP_PRE = '''Threading mode: BGP I/O
+Groups: 2 Peers: 3 Down peers: 0
+Table          Tot Paths  Act Paths Suppressed    History Damp State    Pending
+inet.0
+                  812345     801234          0          0          0          0
+Peer                     AS      InPkt     OutPkt    OutQ   Flaps Last Up/Dwn State|#Active/Received/Accepted/Damped...
+192.168.0.2           65000     123456     123001       0       1 12w3d 4:05:06 Establ
+  inet.0: 400000/406000/406000/0
+192.168.0.3           65000      45678      45012       0       0     3d 2:01:00 Establ
+  inet.0: 401234/406345/406345/0
+203.0.113.1           64512       9876       9800       0       3       20:15 Establ
+  inet.0: 10/12/12/0
+'''
+
+BGP_POST = '''Threading mode: BGP I/O
+Groups: 2 Peers: 3 Down peers: 0
+Table          Tot Paths  Act Paths Suppressed    History Damp State    Pending
+inet.0
+                  812345     801234          0          0          0          0
+Peer                     AS      InPkt     OutPkt    OutQ   Flaps Last Up/Dwn State|#Active/Received/Accepted/Damped...
+192.168.0.2           65000     123501     123046       0       1 12w3d 4:50:06 Establ
+  inet.0: 400000/406000/406000/0
+192.168.0.3           65000      45720      45057       0       0     3d 2:46:00 Establ
+  inet.0: 401234/406345/406345/0
+203.0.113.1           64512       9921       9845       0       3     1:00:15 Establ
+  inet.0: 10/12/12/0
+'''
+
+OSPF_PRE = '''Address          Interface              State           ID               Pri  Dead
+10.0.0.2         ae0.0                  Full            192.168.0.2      128    34
+10.0.0.6         ae1.0                  Full            192.168.0.3      128    38
+'''
+
+OSPF_POST = '''Address          Interface              State           ID               Pri  Dead
+10.0.0.2         ae0.0                  Full            192.168.0.2      128    31
+10.0.0.6         ae1.0                  Full            192.168.0.3      128     9
+'''
+
+INTERFACES_PRE = '''Physical interface: ge-0/0/0, Enabled, Physical link is Up
+  Interface index: 148, SNMP ifIndex: 526
+  Link-level type: Ethernet, MTU: 1514, Speed: 1000mbps, BPDU Error: None, Loop Detect PDU Error: None
+  Device flags   : Present Running
+  Current address: 00:05:86:71:1a:c0, Hardware address: 00:05:86:71:1a:c0
+  Last flapped   : 2024-03-01 10:11:12 UTC (4w2d 03:04 ago)
+  Input rate     : 1024 bps (2 pps)
+  Output rate    : 2048 bps (3 pps)
+  Active alarms  : None
+  Active defects : None
+
+  Logical interface ge-0/0/0.0 (Index 333) (SNMP ifIndex 527)
+    Flags: Up SNMP-Traps 0x4000 Encapsulation: ENET2
+    Input packets : 123456
+    Output packets: 234567
+    Protocol inet, MTU: 1500
+'''
+
+INTERFACES_POST = '''Physical interface: ge-0/0/0, Enabled, Physical link is Up
+  Interface index: 148, SNMP ifIndex: 526
+  Link-level type: Ethernet, MTU: 1514, Speed: 1000mbps, BPDU Error: None, Loop Detect PDU Error: None
+  Device flags   : Present Running
+  Current address: 00:05:86:71:1a:c0, Hardware address: 00:05:86:71:1a:c0
+  Last flapped   : 2024-03-01 10:11:12 UTC (4w2d 03:49 ago)
+  Input rate     : 987654 bps (1201 pps)
+  Output rate    : 12 bps (0 pps)
+  Active alarms  : None
+  Active defects : None
+
+  Logical interface ge-0/0/0.0 (Index 333) (SNMP ifIndex 527)
+    Flags: Up SNMP-Traps 0x4000 Encapsulation: ENET2
+    Input packets : 125001
+    Output packets: 236012
+    Protocol inet, MTU: 1500
+'''
+
+
+@pytest.mark.parametrize('pre, post', [
+    (BGP_PRE, BGP_POST), (OSPF_PRE, OSPF_POST), (INTERFACES_PRE, INTERFACES_POST),
+])
+def test_normalize_drops_the_counters_and_timers(pre, post):
+    assert [normalize(line) for line in pre.splitlines()] == [normalize(line) for line in post.splitlines()]
+
+
+def test_normalize_keeps_the_state():
+    assert normalize('10.0.0.2  ae0.0  Full  192.168.0.2  128  34') != \
+        normalize('10.0.0.2  ae0.0  Init  192.168.0.2  128  34')
+    assert normalize('203.0.113.1  64512  9876  9800  0  3  20:15 Establ') != \
+        normalize('203.0.113.1  64512  9876  9800  0  4  20:15 Active')
+    assert normalize('  Speed: 1000mbps') != normalize('  Speed: 100mbps')
+    assert normalize('  Input rate     : 1024 bps (2 pps)') == ' Input rate : <n> bps (<n> pps)'
+
+
+def snapshots(tmp_path, pre, post):
+    pre_path, post_path = str(tmp_path / 'pre.txt'), str(tmp_path / 'post.txt')
+    write_snapshot(pre_path, pre)
+    write_snapshot(post_path, post)
+    return list(diff_snapshots(pre_path, post_path))
+
+
+def test_diff_snapshots_skips_the_noise(tmp_path):
+    pre = {'show bgp summary': BGP_PRE, 'show ospf neighbor': OSPF_PRE, 'show interfaces ge-0/0/0': INTERFACES_PRE}
+    post = {'show bgp summary': BGP_POST, 'show ospf neighbor': OSPF_POST,
+            'show interfaces ge-0/0/0': INTERFACES_POST}
+    assert snapshots(tmp_path, pre, post) == []
+
+
+def test_diff_snapshots_shows_the_changes(tmp_path):
+    bgp_down = BGP_POST.replace('64512       9921       9845       0       3     1:00:15 Establ\n  inet.0: 10/12/12/0',
+                                '64512       9921       9845       0       4          12 Active')
+    ospf_down = OSPF_POST.replace('ae1.0                  Full', 'ae1.0                  Init')
+    diff = snapshots(tmp_path, {'show bgp summary': BGP_PRE, 'show ospf neighbor': OSPF_PRE, 'show version': 'x'},
+                     {'show bgp summary': bgp_down, 'show ospf neighbor': ospf_down, 'show route': 'y'})
+    assert diff == [
+        '@@@ show bgp summary',
+        '    inet.0: 401234/406345/406345/0',
+        '- 203.0.113.1           64512       9876       9800       0       3       20:15 Establ',
+        '-   inet.0: 10/12/12/0',
+        '+ 203.0.113.1           64512       9921       9845       0       4          12 Active',
+        '@@@ show ospf neighbor',
+        '  10.0.0.2         ae0.0                  Full            192.168.0.2      128    34',
+        '- 10.0.0.6         ae1.0                  Full            192.168.0.3      128    38',
+        '+ 10.0.0.6         ae1.0                  Init            192.168.0.3      128     9',
+        '+++ show route (not in pre checks)',
+        '--- show version (not in post checks)',
+    ]
+
+
+def test_diff_snapshots_shows_prefix_drops_and_errors(tmp_path):
+    interfaces = INTERFACES_POST.replace('    Output packets: 236012',
+                                         '    Output packets: 236012\n    Input errors: 0, Output drops: 0')
+    bgp_post = BGP_POST.replace('  inet.0: 400000/406000/406000/0', '  inet.0: 200000/206000/206000/0')
+    diff = snapshots(tmp_path, {'show bgp summary': BGP_PRE, 'show interfaces ge-0/0/0': interfaces},
+                     {'show bgp summary': bgp_post,
+                      'show interfaces ge-0/0/0': interfaces.replace('Input errors: 0', 'Input errors: 5012')})
+    assert '-   inet.0: 400000/406000/406000/0' in diff
+    assert '+   inet.0: 200000/206000/206000/0' in diff
+    assert '-     Input errors: 0, Output drops: 0' in diff
+    assert '+     Input errors: 5012, Output drops: 0' in diff
+
+
+def test_normalize_keeps_route_counts_and_asns():
+    assert normalize('                  1234567     801234          0') != \
+        normalize('                       12     801234          0')
+    assert normalize('192.168.0.2  4200000001  123456  123001  0  1 12w3d 4:05:06 Establ') != \
+        normalize('192.168.0.2  4200000002  123456  123001  0  1 12w3d 4:05:06 Establ')
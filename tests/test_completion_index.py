@@ -0,0 +1,36 @@
+from net_store import CompletionIndex
+
+HOSTS = {
+    'MX240-1': {'site': {'AMS'}},
+    'ams-mx480-2': {'site': {'AMS'}},
+    'fra-ptx-1': {'site': {'FRA'}},
+    'fra-mx960-1': {'site': {'FRA'}},
+}
+
+
+def names(results):
+    return [name for name, _ in results]
+
+
+def index():
+    completion_index = CompletionIndex()
+    completion_index.update(HOSTS)
+    return completion_index
+
+
+def test_search_prefix_then_substring():
+    assert index().search('mx') == [('MX240-1', [(0, 2)]), ('ams-mx480-2', [(4, 6)]), ('fra-mx960-1', [(4, 6)])]
+    assert names(index().search('mx960')) == ['fra-mx960-1']
+
+
+def test_search_short_text_without_trigrams():
+    assert index().search('40') == [('MX240-1', [(3, 5)])]
+    assert names(index().search('site:ams mx')) == ['MX240-1', 'ams-mx480-2']
+    assert names(index().search('site:fra x')) == ['fra-mx960-1', 'fra-ptx-1']
+
+
+def test_search_short_text_is_bounded():
+    completion_index = CompletionIndex(max_candidates=2)
+    completion_index.update(HOSTS)
+    # Only the first two names in order are scanned, ams-mx480-2 and fra-mx960-1
+    assert names(completion_index.search('1')) == ['fra-mx960-1']
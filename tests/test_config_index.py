@@ -0,0 +1,87 @@
+import re
+
+import pytest
+
+from net_store import ConfigIndex, required_literals
+
+CONFIGS = {
+    'R1': '''set system host-name R1
+set interfaces ae0 unit 0 family inet address 10.0.0.1/30
+set interfaces ae0 unit 0 description "to R2 BGP"
+set protocols bgp group ibgp type internal
+set protocols bgp group ibgp neighbor 192.168.0.2
+set protocols bgp group ebgp neighbor 203.0.113.1 peer-as 64512
+set protocols BGP-like typo
+set protocols isis interface ae0.0 point-to-point
+set protocols isis level 2 wide-metrics-only
+set protocols ISIS-comment annotation
+set protocols ospf area 0.0.0.0 interface ae0.0
+set policy-options policy-statement bgp-export term 1 then accept
+set policy-options policy-statement BGP-IMPORT term 1 then reject
+set routing-options autonomous-system 65000''',
+    'R2': '''set system host-name R2
+set interfaces ae0 unit 0 family inet address 10.0.0.2/30
+set protocols bgp group ibgp neighbor 192.168.0.1
+set protocols ldp interface ae0.0
+set protocols mpls interface ae0.0''',
+}
+
+PATTERNS = [
+    'bgp', '(?i)bgp', '(?i)ISIS', 'BGP', 'isis', 'bgp group \\w+ neighbor', 'neighbor 192\\.168\\.0\\.\\d',
+    'ae0(\\.0)?', 'inet address 10\\.0\\.0\\.[12]/30', '^set protocols', 'accept$', 'bgp|ldp', 'mpl?s',
+    'i[sS]is', 'policy-statement (?:bgp|BGP)', '(?x) bgp \\s group', 'host-name R[0-9]+', 'a{2}', 'ibgp\\b',
+    '[invalid', 'peer-as 6451.?', 'Ae0', 'IBGP neighbor', '[^]]bgp', '[]x]bgp', '[^\\]]bgp', '[INVALID',
+]
+
+
+def brute_force(configs, pattern):
+    # Case insensitive, like '| match' on the device
+    try:
+        matches = re.compile(pattern, re.I).search
+    except re.error:
+        def matches(line):
+            return pattern.lower() in line.lower()
+    result = {}
+    for device, config in configs.items():
+        lines = [line for line in config.splitlines() if line and matches(line)]
+        if lines:
+            result[device] = lines
+    return result
+
+
+@pytest.fixture
+def index():
+    index = ConfigIndex()
+    for device, config in CONFIGS.items():
+        index.index_device(device, 1, config)
+    return index
+
+
+@pytest.mark.parametrize('pattern', PATTERNS)
+def test_search_matches_brute_force(index, pattern):
+    assert index.search(pattern) == brute_force(CONFIGS, pattern)
+
+
+@pytest.mark.parametrize('pattern', PATTERNS)
+def test_search_of_one_device(index, pattern):
+    expected = {device: lines for device, lines in brute_force(CONFIGS, pattern).items() if device == 'R2'}
+    assert index.search(pattern, devices=['R2']) == expected
+
+
+def test_required_literals():
+    assert required_literals('bgp group \\w+ neighbor') == ['bgp group ', ' neighbor']
+    assert required_literals('bgp|ldp') == []
+    assert required_literals('ae0(\\.0)?') == ['ae0']
+    assert required_literals('mpl?s') == []
+    assert required_literals('[^]]abc') == ['abc']
+    assert required_literals('[]a]abc') == ['abc']
+    assert required_literals('[\\]]abc') == ['abc']
+
+
+def test_reindexing_frees_replaced_lines(index):
+    for commit in range(2, 50):
+        index.index_device('R2', commit, CONFIGS['R2'] + f'\nset system commit-note {commit}')
+    assert len(index.line_text) <= len(CONFIGS['R1'].splitlines()) + len(CONFIGS['R2'].splitlines()) + 2
+    assert index.search('commit-note') == {'R2': ['set system commit-note 49']}
+    index.remove_device('R2')
+    assert 'R2' not in str(index.search('host-name'))
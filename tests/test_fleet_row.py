@@ -0,0 +1,17 @@
+from nornir.core.task import MultiResult, Result
+
+from net_tui import fleet_row
+
+
+def main_task_result(panel_data):
+    result = MultiResult('main_task')
+    result.append(Result(host=None, result={'data': panel_data, 'latency': {}}))
+    return result
+
+
+def test_fleet_row_of_a_host_with_failed_rpcs_is_partial():
+    row = fleet_row('R1', main_task_result({'facts': {'model': 'mx480'}, 'alarms': TimeoutError(),
+                                            'cpu': ValueError()}))
+    assert row['status'] == 'partial (alarms, cpu failed)'
+    assert row['model'] == 'mx480'
+    assert fleet_row('R1', main_task_result({'facts': {'model': 'mx480'}}))['status'] == 'ok'
@@ -0,0 +1,48 @@
+import threading
+from types import SimpleNamespace
+
+from nornir.core.task import MultiResult, Result
+
+import net_tui
+from net_store import HardwareIndex
+
+
+class FakeNornir:
+    def __init__(self, hosts):
+        self.inventory = SimpleNamespace(hosts=dict.fromkeys(hosts))
+        self.hosts = hosts
+
+    def filter(self, filter_func):
+        return FakeNornir([host for host in self.hosts if filter_func(SimpleNamespace(name=host))])
+
+
+def test_refreshes_going_on_together_fetch_each_device_once(tmp_path, monkeypatch):
+    fetched = []
+    started = threading.Event()
+    release = threading.Event()
+
+    def stream_run(nornir_obj, on_host, task):
+        fetched.extend(nornir_obj.hosts)
+        started.set()
+        release.wait(5)
+        for host in nornir_obj.hosts:
+            result = MultiResult('chassis_task')
+            result.append(Result(host=None, result=[SimpleNamespace(model='MPC7E', slot_path='FPC 0', serial=host)]))
+            on_host(host, result)
+
+    monkeypatch.setattr(net_tui, 'nr', FakeNornir(['R1', 'R2']))
+    monkeypatch.setattr(net_tui, 'hw_index', HardwareIndex(str(tmp_path)))
+    monkeypatch.setattr(net_tui, 'stream_run', stream_run)
+    background = threading.Thread(target=net_tui.refresh_hw_index, args=(3600,))
+    background.start()
+    started.wait(5)
+    done = []
+    lookup = threading.Thread(target=net_tui.refresh_hw_index, args=(float('inf'), lambda host, _: done.append(host)))
+    lookup.start()
+    release.set()
+    background.join(5)
+    lookup.join(5)
+    assert sorted(fetched) == ['R1', 'R2']
+    assert sorted(done) == ['R1', 'R2']
+    assert net_tui.hw_fetches == {}
+    assert net_tui.hw_index.lookup('MPC7E') == [('R1', 'FPC 0', 'R1'), ('R2', 'FPC 0', 'R2')]
@@ -0,0 +1,42 @@
+import pytest
+from nornir.core.task import MultiResult, Result
+
+from net_batch import host_status, parse_args, search_lines
+from scheduler import CircuitOpen, HostTimeout, RunCancelled
+
+
+def multi_result(failed=False, exception=None):
+    result = MultiResult('task')
+    result.append(Result(host=None, result=None, failed=failed, exception=exception))
+    return result
+
+
+@pytest.mark.parametrize('result, status', [
+    (multi_result(), 'ok'),
+    (multi_result(True, HostTimeout('R1 timed out after 120 seconds')), 'timed_out'),
+    (multi_result(True, CircuitOpen('R1 skipped, failed 3 runs in a row')), 'skipped'),
+    (multi_result(True, RunCancelled('R1 run cancelled')), 'cancelled'),
+    (multi_result(True, ConnectionRefusedError('R1: connection refused')), 'failed'),
+    (multi_result(True), 'failed'),
+])
+def test_host_status(result, status):
+    assert host_status(result) == status
+
+
+def test_host_status_of_a_failed_subtask():
+    result = multi_result()
+    result.append(Result(host=None, result=None, failed=True, exception=KeyError('facts')))
+    assert host_status(result) == 'failed'
+
+
+def test_search_lines():
+    config = 'set protocols bgp group ibgp\nset protocols ospf area 0\nset system host-name R1 [lab]'
+    assert search_lines(config, 'bgp|ospf') == ['set protocols bgp group ibgp', 'set protocols ospf area 0']
+    # Not a valid regex, matched as plain text
+    assert search_lines(config, '[lab') == ['set system host-name R1 [lab]']
+
+
+def test_parse_args_rejects_a_remote_filter_napalm_cant_pass_on():
+    assert parse_args(['cmds', 'show bgp summary', '--remote-filter', 'except Establ']).remote_filter == 'except Establ'
+    with pytest.raises(SystemExit):
+        parse_args(['cmds', 'show bgp summary', '--remote-filter', 'Establ Active'])
@@ -0,0 +1,24 @@
+from net_store import OutputArchive
+
+
+def test_put_many_counts_the_outputs_changed_per_device_and_command(tmp_path):
+    archive = OutputArchive(str(tmp_path))
+    assert archive.put_many('R1', {'show version': 'a', 'show bgp summary': 'b'}, 'test', collected=1) == 2
+    assert archive.put_many('R1', {'show version': 'a', 'show bgp summary': 'c'}, 'test', collected=2) == 1
+    # Seen on R1 already, but new for R2
+    assert archive.put_many('R2', {'show version': 'a'}, 'test', collected=3) == 1
+    # Same as two fetches ago, but not as the last one
+    assert archive.put_many('R1', {'show bgp summary': 'b'}, 'test', collected=4) == 1
+    assert archive.stats()[:2] == (6, 3)
+    archive.close()
+
+
+def test_history_matches_the_wildcards_literally(tmp_path):
+    archive = OutputArchive(str(tmp_path))
+    archive.put_many('core_1', {'show route 10%': 'x'}, 'test', collected=1)
+    archive.put_many('coreA1', {'show route 100': 'y'}, 'test', collected=2)
+    assert [row[1] for row in archive.history('core_')] == ['core_1']
+    assert [row[1] for row in archive.history('core')] == ['coreA1', 'core_1']
+    assert [row[2] for row in archive.history('', '10%')] == ['show route 10%']
+    assert [row[2] for row in archive.history('', 'route 1')] == ['show route 100', 'show route 10%']
+    archive.close()
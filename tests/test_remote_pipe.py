@@ -0,0 +1,80 @@
+import re
+
+import pytest
+
+from net_tui import remote_pipe
+
+JunOSDriver = pytest.importorskip('napalm.junos.junos').JunOSDriver
+
+BGP_SUMMARY = '''Groups: 2 Peers: 3 Down peers: 1
+Peer                     AS      InPkt     OutPkt    OutQ   Flaps Last Up/Dwn State|#Active/Received/Accepted/Damped...
+192.168.0.2           65000     123456     123001       0       1 12w3d 4:05:06 Establ
+  inet.0: 400000/406000/406000/0
+192.168.0.3           65000     123400     123010       0       0 12w3d 4:05:01 Establ
+  inet.0: 401234/406345/406345/0
+203.0.113.1           64512         12         10       0       3        2:01 Active
+'''
+
+
+class FakeDevice:
+    """pyez Device cli(), applying the match/except/last pipes like Junos does"""
+
+    def __init__(self, output):
+        self.output = output
+        self.commands = []
+
+    def cli(self, command, warning=True, format='text'):
+        self.commands.append(command)
+        lines = self.output.splitlines()
+        for pipe in command.split('|')[1:]:
+            action, _, argument = pipe.strip().partition(' ')
+            argument = argument.strip('"')
+            if action == 'match':
+                lines = [line for line in lines if re.search(argument, line, re.I)]
+            elif action == 'except':
+                lines = [line for line in lines if not re.search(argument, line, re.I)]
+            elif action == 'last':
+                lines = lines[-int(argument):]
+        return '\n'.join(lines)
+
+
+def run_cli(remote_filter):
+    driver = JunOSDriver.__new__(JunOSDriver)
+    driver.device = FakeDevice(BGP_SUMMARY)
+    command = 'show bgp summary' + remote_pipe(remote_filter)
+    # napalm rebuilds the command around ' | ', doubling the space before the first pipe
+    return driver.cli([command])[command], ' '.join(driver.device.commands[0].split())
+
+
+@pytest.mark.parametrize('remote_filter, sent', [
+    ('', 'show bgp summary'),
+    ('Establ', 'show bgp summary | match Establ'),
+    ('match "Establ"', 'show bgp summary | match Establ'),
+    ("| match 'Establ'", 'show bgp summary | match Establ'),
+    ('match Estab.*', 'show bgp summary | match Estab.*'),
+    ('except Establ', 'show bgp summary | except Establ'),
+    ('match Establ | last 1', 'show bgp summary | match Establ | last 1'),
+])
+def test_remote_pipe_through_napalm(remote_filter, sent):
+    output, command = run_cli(remote_filter)
+    assert command == sent
+    assert output == FakeDevice(BGP_SUMMARY).cli(sent)
+    assert output
+
+
+def test_remote_pipe_filters_like_the_device():
+    output, _ = run_cli('match "Establ"')
+    assert output.splitlines() == [line for line in BGP_SUMMARY.splitlines() if 'Establ' in line]
+    output, _ = run_cli('except Establ')
+    assert 'Active' in output and 'Establ' not in output
+    output, _ = run_cli('Establ | last 1')
+    assert output == BGP_SUMMARY.splitlines()[4]
+
+
+@pytest.mark.parametrize('remote_filter', [
+    'Established Active', 'match "Establ Active"', 'except Down Idle', 'match Establ | save out.txt',
+    'match Establ | count', 'trim 5', 'match', '| except', 'except Down | match', 'match ""',
+])
+def test_remote_pipe_rejects_what_napalm_cant_pass_on(remote_filter):
+    with pytest.raises(ValueError):
+        remote_pipe(remote_filter)
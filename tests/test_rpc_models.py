@@ -0,0 +1,69 @@
+import io
+import json
+import os
+from xml.sax import make_parser
+
+import pytest
+from lxml import etree
+
+from conn_pool import SaxNapalm
+from rpc_models import RPC_PARSERS
+
+ncclient_rpc = pytest.importorskip('ncclient.operations.rpc')
+junos_parser = pytest.importorskip('ncclient.transport.third_party.junos.parser')
+
+RECORDING = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks', 'recordings',
+                         'mx480.json')
+with open(RECORDING, 'r') as f:
+    REPLIES = json.load(f)['rpc']
+
+
+class FakeRpc:
+    def __init__(self, filter_xml):
+        self._filter_xml = etree.fromstring(filter_xml)
+
+
+class FakeSession:
+    """The parts of an ncclient session the junos SAX parser uses, with the RPC of message-id 1 pending"""
+
+    def __init__(self, filter_xml):
+        listener = object.__new__(ncclient_rpc.RPCReplyListener)
+        listener._id2rpc = {'1': FakeRpc(filter_xml)}
+        self._listeners = {listener}
+        self._buffer = io.BytesIO()
+
+
+def sax_pruned(reply, filter_xml):
+    """Returns the reply as ncclient's SAX parser passes it on with use_filter"""
+    session = FakeSession(filter_xml)
+    parser = make_parser()
+    parser.setContentHandler(junos_parser.SAXParser(session))
+    parser.feed(f'<rpc-reply message-id="1">{reply}</rpc-reply>')
+    parser.close()
+    return etree.fromstring(session._buffer.getvalue())[0]
+
+
+@pytest.mark.parametrize('rpc', [rpc for rpc, (filter_xml, _) in RPC_PARSERS.items() if filter_xml])
+def test_filters_keep_what_the_parsers_need(rpc):
+    filter_xml, parse = RPC_PARSERS[rpc]
+    assert parse(sax_pruned(REPLIES[rpc], filter_xml)) == parse(etree.fromstring(REPLIES[rpc]))
+
+
+def test_sax_napalm_opens_the_device_with_use_filter(monkeypatch):
+    opened = {}
+
+    class FakeDevice:
+        _use_filter = False
+
+    class FakeDriver:
+        def __init__(self, hostname, username, password, optional_args):
+            self.device = FakeDevice()
+            opened['optional_args'] = optional_args
+
+        def open(self):
+            opened['use_filter'] = self.device._use_filter
+
+    monkeypatch.setattr('napalm.get_network_driver', lambda platform: FakeDriver)
+    plugin = SaxNapalm()
+    plugin.open('r1', 'lab', 'lab', 830, 'junos')
+    assert opened == {'optional_args': {'port': 830}, 'use_filter': True}
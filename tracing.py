@@ -0,0 +1,104 @@
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+
+from net_store import write_json
+
+
+def no_span(stage, name):
+    return nullcontext()
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+class Tracer:
+    """
+    Nornir processor recording how long each host task takes, along with the spans timed inside
+    the tasks and the UI: connecting, RPCs (execution and transfer, pyez doesn't tell them
+    apart), CLI commands, parsing the replies into the models and building the tables shown
+    from them (Textual paints them later, outside the spans). The latest max_spans spans are
+    kept, to report the slowest hosts and the p50/p95 of each RPC, and to be exported as a
+    Chrome trace (chrome://tracing, ui.perfetto.dev).
+    """
+
+    def __init__(self, max_spans=100000):
+        self.spans = deque(maxlen=max_spans)  # (host, stage, name, start, seconds, thread id)
+        self.started = {}  # id of the host task -> start time
+        self.origin = time.perf_counter()
+
+    def add(self, host, stage, name, start, seconds):
+        # deque appends are thread safe
+        self.spans.append((host, stage, name, start, seconds, threading.get_ident()))
+
+    @contextmanager
+    def span(self, host, stage, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(host, stage, name, start, time.perf_counter() - start)
+
+    def host_span(self, host):
+        """Returns span(stage, name) timing the spans of the host, for the rpc_models parsers"""
+        return lambda stage, name: self.span(host, stage, name)
+
+    def task_started(self, task):
+        pass
+
+    def task_completed(self, task, result):
+        pass
+
+    def task_instance_started(self, task, host):
+        self.started[id(task)] = time.perf_counter()
+
+    def task_instance_completed(self, task, host, result):
+        start = self.started.pop(id(task), None)
+        if start is not None:
+            self.add(host.name, 'task', task.name, start, time.perf_counter() - start)
+
+    def subtask_instance_started(self, task, host):
+        pass
+
+    def subtask_instance_completed(self, task, host, result):
+        pass
+
+    def rpc_stats(self):
+        """Returns [(stage, name, count, p50, p95, max)] of every stage/name, slowest p95 first"""
+        durations = {}
+        for _, stage, name, _, seconds, _ in list(self.spans):
+            durations.setdefault((stage, name), []).append(seconds)
+        stats = []
+        for (stage, name), values in durations.items():
+            values.sort()
+            stats.append((stage, name, len(values), percentile(values, 0.5), percentile(values, 0.95), values[-1]))
+        return sorted(stats, key=lambda stat: -stat[4])
+
+    def slowest_hosts(self, limit=10):
+        """Returns [(host, task seconds, slowest (stage, name, seconds) within the host)] of the slowest host tasks"""
+        tasks = {}
+        slowest = {}
+        for host, stage, name, _, seconds, _ in list(self.spans):
+            if stage == 'task':
+                tasks[host] = max(tasks.get(host, 0), seconds)
+            elif stage != 'build' and seconds > slowest.get(host, ('', '', 0))[2]:
+                slowest[host] = (stage, name, seconds)
+        ranked = sorted(tasks.items(), key=lambda item: -item[1])[:limit]
+        return [(host, seconds, slowest.get(host)) for host, seconds in ranked]
+
+    def export(self, path):
+        """Writes the spans as a Chrome trace event file, returns the number of spans written"""
+        events = []
+        pids = {}  # host -> pid, so each host gets its own lane in the trace viewer
+        for host, stage, name, start, seconds, thread_id in list(self.spans):
+            if host not in pids:
+                pids[host] = len(pids) + 1
+                events.append({'name': 'process_name', 'ph': 'M', 'pid': pids[host], 'args': {'name': host}})
+            events.append({'name': f'{stage} {name}', 'cat': stage, 'ph': 'X', 'pid': pids[host], 'tid': thread_id,
+                           'ts': round((start - self.origin) * 1e6), 'dur': round(seconds * 1e6)})
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        write_json(path, {'traceEvents': events, 'displayTimeUnit': 'ms'})
+        return len(events) - len(pids)